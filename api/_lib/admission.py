@@ -0,0 +1,113 @@
+"""Admission control for the explain pipeline.
+
+A request goes through two very different stages: CPU-bound parsing (parse ->
+steps -> diagram, milliseconds) and the outbound model call (network-bound, up
+to `ai._TIMEOUT_SEC`). Each stage gets its own concurrency limit and a bounded
+wait queue, so a burst of slow model calls can't starve the fast deterministic
+work behind it and the queue can't grow without bound.
+
+Admission is deadline-aware: a request that would, by the stage's recent
+service times, still be queued when its deadline passes is turned away at once
+with `Overloaded` (the handler maps it to 429 + Retry-After) instead of timing
+out later. On Vercel each instance serves one request at a time, so this mostly
+bites when the handler runs under a threaded server (local dev, `vercel dev`,
+self-hosting) - but it costs nothing when uncontended.
+
+Limits come from the environment: CODELENS_PARSE_CONCURRENCY /
+CODELENS_PARSE_QUEUE and CODELENS_AI_CONCURRENCY / CODELENS_AI_QUEUE.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class Overloaded(Exception):
+    """Raised when a stage can't admit a request before its deadline."""
+
+    def __init__(self, stage: str, retry_after: int) -> None:
+        super().__init__(f"{stage} stage is saturated")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+class Stage:
+    """A concurrency limit plus a bounded, deadline-aware wait queue."""
+
+    # Weight of the newest sample in the moving average of service time.
+    _EWMA_ALPHA = 0.2
+
+    def __init__(self, name: str, limit: int, max_queue: int, typical_sec: float = 0.05) -> None:
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        # Seeded with a guess so the first requests get a sensible estimate.
+        self._service_sec = typical_sec
+
+    def expected_wait(self) -> float:
+        """Rough seconds until a newly queued request would start."""
+        with self._cond:
+            return self._expected_wait_locked()
+
+    def _expected_wait_locked(self) -> float:
+        if self._active < self.limit:
+            return 0.0
+        return (self._waiting + 1) / self.limit * self._service_sec
+
+    def _reject(self, wait: float) -> Overloaded:
+        return Overloaded(self.name, max(1, math.ceil(wait)))
+
+    @contextmanager
+    def admit(self, deadline: float) -> Iterator[None]:
+        """Hold one slot of this stage for the duration of the `with` block.
+
+        `deadline` is a `time.monotonic()` timestamp. Raises `Overloaded` when
+        the queue is full, when the estimated wait already overshoots the
+        deadline, or when the deadline passes while queued.
+        """
+        with self._cond:
+            if self._active >= self.limit:
+                wait = self._expected_wait_locked()
+                if self._waiting >= self.max_queue or time.monotonic() + wait > deadline:
+                    raise self._reject(wait)
+                self._waiting += 1
+                try:
+                    while self._active >= self.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise self._reject(self._expected_wait_locked())
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._active += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self._active -= 1
+                self._service_sec += self._EWMA_ALPHA * (elapsed - self._service_sec)
+                self._cond.notify()
+
+
+PARSE = Stage("parse", _env_int("CODELENS_PARSE_CONCURRENCY", os.cpu_count() or 1),
+              _env_int("CODELENS_PARSE_QUEUE", 32), typical_sec=0.05)
+AI = Stage("ai", _env_int("CODELENS_AI_CONCURRENCY", 4),
+           _env_int("CODELENS_AI_QUEUE", 8), typical_sec=5.0)
@@ -6,9 +6,21 @@ GEMINI_API_KEY happens to be set we prefer Google's model, but neither is
 required - everything degrades gracefully to a deterministic heuristic so the
 app never breaks and never blocks the user behind a paywall.
 
+Concurrent requests can be micro-batched (off by default): whoever arrives
+first opens a batch, waits a few milliseconds for company, and sends every
+snippet that joined in one prompt asking for a keyed JSON array. Each caller
+gets its own answer back, or the heuristic if the model skipped it. With
+rate-limited free providers the per-request overhead (TLS, queueing, the prompt
+preamble) is most of the cost for small snippets, so this buys throughput for a
+few ms of latency. Turn it on with CODELENS_AI_BATCH_MAX > 1.
+
 Security note: the outbound request targets a single hard-coded, trusted host
 (constant URL below). User code is only ever sent in the JSON body as prompt
 text, never used to build the destination URL, so there is no SSRF surface here.
+A batched prompt, though, carries several callers' code side by side, and
+nothing stops the model from quoting one snippet in another's answer. That is
+only acceptable when every caller is the same tenant (a private or
+single-team deployment), which is why batching is opt-in.
 """
 
 from __future__ import annotations
@@ -16,8 +28,10 @@ from __future__ import annotations
 import json
 import os
 import re
-import urllib.request
-from typing import Any, Dict, List, Optional
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from . import complexity
 
 # Fixed, trusted endpoints. These are constants, not derived from user input.
 _POLLINATIONS_URL = "https://text.pollinations.ai/openai"
@@ -25,6 +39,30 @@ _GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.
 
 _TIMEOUT_SEC = 20
 
+# When the static analyzer is at least this sure of its Big-O, skip the model.
+try:
+    _STATIC_CONFIDENCE = float(os.getenv("CODELENS_STATIC_CONFIDENCE", "0.9"))
+except ValueError:
+    _STATIC_CONFIDENCE = 0.9
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+# Micro-batching: how long the first caller waits for others to join, and how
+# much a batch may hold (snippets, and characters of code across them). One
+# snippet per prompt by default; see the security note above before raising it.
+_BATCH_WINDOW_SEC = _env_number("CODELENS_AI_BATCH_WINDOW_MS", 5) / 1000
+_BATCH_MAX_ITEMS = int(_env_number("CODELENS_AI_BATCH_MAX", 1))
+_BATCH_MAX_CHARS = int(_env_number("CODELENS_AI_BATCH_CHARS", 16000))
+
+# Code beyond this many characters is cut from a snippet's prompt.
+_CODE_CHARS = 6000
+
 # Pollinations sits behind Cloudflare, which blocks the default Python
 # user-agent. A standard browser UA gets us through.
 _USER_AGENT = (
@@ -33,20 +71,43 @@ _USER_AGENT = (
 )
 
 
+_FIELD_RULES = (
+    "- summary: 2-3 sentences in plain English explaining what the code does "
+    "and any notable edge cases. No restating every variable.\n"
+    "- complexity: the worst-case time complexity in Big-O notation, e.g. "
+    '"O(n)" or "O(n log n)", with a 3-6 word reason.\n\n'
+)
+
+
+def _notes(steps: List[Dict[str, Any]], limit: int) -> str:
+    return "\n".join(f"- {s.get('text', '')}" for s in steps[:limit])
+
+
 def _build_prompt(code: str, steps: List[Dict[str, Any]]) -> str:
-    notes = "\n".join(f"- {s.get('text', '')}" for s in steps[:40])
     return (
         "You are a precise, friendly code reviewer. Given the code and the "
         "extracted steps below, respond with STRICT JSON only (no markdown), "
         'shaped exactly as {"summary": string, "complexity": string}.\n'
-        "- summary: 2-3 sentences in plain English explaining what the code does "
-        "and any notable edge cases. No restating every variable.\n"
-        "- complexity: the worst-case time complexity in Big-O notation, e.g. "
-        '"O(n)" or "O(n log n)", with a 3-6 word reason.\n\n'
-        f"Code:\n```\n{code[:6000]}\n```\n\nExtracted steps:\n{notes}\n"
+        + _FIELD_RULES
+        + f"Code:\n```\n{code[:_CODE_CHARS]}\n```\n\nExtracted steps:\n{_notes(steps, 40)}\n"
     )
 
 
+def _build_batch_prompt(items: List[_Request]) -> str:
+    """One prompt for several unrelated snippets, answered as a keyed array."""
+    parts = [
+        f"You are a precise, friendly code reviewer. Below are {len(items)} "
+        "independent code snippets, each with an id and its extracted steps. "
+        "Respond with STRICT JSON only (no markdown): an array with one object "
+        'per snippet, shaped exactly as {"id": string, "summary": string, '
+        '"complexity": string}. Judge each snippet on its own.\n' + _FIELD_RULES
+    ]
+    for i, item in enumerate(items, start=1):
+        parts.append(f"Snippet id {i}:\nCode:\n```\n{item.code[:_CODE_CHARS]}\n```\n"
+                     f"Extracted steps:\n{_notes(item.steps, 20)}\n\n")
+    return "".join(parts)
+
+
 def _extract_json(text: str) -> Optional[Dict[str, Any]]:
     """Pull the first JSON object out of a model response, tolerating stray
     prose or code fences around it."""
@@ -62,7 +123,25 @@ def _extract_json(text: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+def _extract_json_array(text: str) -> Optional[List[Any]]:
+    """Like `_extract_json`, for the array a batched prompt asks for."""
+    if not text:
+        return None
+    match = re.search(r"\[.*\]", text, re.DOTALL)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+        return data if isinstance(data, list) else None
+    except json.JSONDecodeError:
+        return None
+
+
 def _post_json(url: str, payload: Dict[str, Any], headers: Dict[str, str]) -> str:
+    # Deferred: urllib.request pulls in http.client, ssl and email, which only
+    # requests that actually call a model should pay for.
+    import urllib.request
+
     body = json.dumps(payload).encode("utf-8")
     headers = {"User-Agent": _USER_AGENT, **headers}
     req = urllib.request.Request(url, data=body, headers=headers, method="POST")
@@ -70,15 +149,14 @@ def _post_json(url: str, payload: Dict[str, Any], headers: Dict[str, str]) -> st
         return resp.read().decode("utf-8")
 
 
-def _call_gemini(prompt: str, api_key: str) -> Optional[Dict[str, Any]]:
+def _call_gemini(prompt: str, api_key: str) -> str:
     payload = {"contents": [{"parts": [{"text": prompt}]}]}
     raw = _post_json(f"{_GEMINI_URL}?key={api_key}", payload, {"Content-Type": "application/json"})
     data = json.loads(raw)
-    text = data["candidates"][0]["content"]["parts"][0]["text"]
-    return _extract_json(text)
+    return data["candidates"][0]["content"]["parts"][0]["text"]
 
 
-def _call_pollinations(prompt: str) -> Optional[Dict[str, Any]]:
+def _call_pollinations(prompt: str) -> str:
     payload = {
         "model": "openai",
         "messages": [{"role": "user", "content": prompt}],
@@ -86,17 +164,120 @@ def _call_pollinations(prompt: str) -> Optional[Dict[str, Any]]:
     raw = _post_json(_POLLINATIONS_URL, payload, {"Content-Type": "application/json"})
     # The endpoint mirrors the OpenAI chat schema.
     try:
-        text = json.loads(raw)["choices"][0]["message"]["content"]
+        return json.loads(raw)["choices"][0]["message"]["content"]
     except (KeyError, IndexError, json.JSONDecodeError):
-        text = raw
-    return _extract_json(text)
+        return raw
+
+
+def _complete(prompt: str) -> str:
+    """The model's raw text reply, from Gemini when keyed, else Pollinations."""
+    gemini_key = os.getenv("GEMINI_API_KEY")
+    return _call_gemini(prompt, gemini_key) if gemini_key else _call_pollinations(prompt)
+
+
+class _Request:
+    """One caller's snippet, waiting for its share of a batched answer."""
+
+    __slots__ = ("code", "steps", "chars", "answer", "done")
+
+    def __init__(self, code: str, steps: List[Dict[str, Any]]) -> None:
+        self.code = code
+        self.steps = steps
+        self.chars = min(len(code), _CODE_CHARS)
+        self.answer: Optional[Dict[str, Any]] = None
+        self.done = threading.Event()
+
+
+class _Batch:
+    __slots__ = ("requests", "chars", "full")
+
+    def __init__(self, first: _Request) -> None:
+        self.requests = [first]
+        self.chars = first.chars
+        self.full = threading.Event()
+
+
+def _ask_model(requests: List[_Request]) -> List[Optional[Dict[str, Any]]]:
+    """One model call for a batch; answers line up with `requests`, None where
+    the model failed or left a snippet out."""
+    try:
+        if len(requests) == 1:
+            only = requests[0]
+            return [_extract_json(_complete(_build_prompt(only.code, only.steps)))]
+        answers = _extract_json_array(_complete(_build_batch_prompt(requests))) or []
+    except Exception:
+        # Network/timeout/parse issues should never surface to the user - every
+        # caller simply falls back to the deterministic estimate.
+        return [None] * len(requests)
+    by_id = {str(a.get("id")).strip(): a for a in answers if isinstance(a, dict)}
+    return [by_id.get(str(i)) for i in range(1, len(requests) + 1)]
+
+
+class _Batcher:
+    """Leader-based micro-batcher.
+
+    The first caller to find no open batch becomes its leader: it waits up to
+    `window_sec` (less if the batch fills), closes the batch, makes the one
+    model call and hands every follower its answer. Followers just wait.
+    """
+
+    def __init__(self, send: Callable[[List[_Request]], List[Optional[Dict[str, Any]]]],
+                 window_sec: float, max_items: int, max_chars: int) -> None:
+        self._send = send
+        self._window = window_sec
+        self._max_items = max_items
+        self._max_chars = max_chars
+        self._lock = threading.Lock()
+        self._open: Optional[_Batch] = None
+
+    def ask(self, code: str, steps: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        request = _Request(code, steps)
+        if self._max_items <= 1 or self._window <= 0:
+            return self._send([request])[0]
+
+        with self._lock:
+            batch = self._open
+            if (batch is not None and len(batch.requests) < self._max_items
+                    and batch.chars + request.chars <= self._max_chars):
+                batch.requests.append(request)
+                batch.chars += request.chars
+                if len(batch.requests) >= self._max_items:
+                    batch.full.set()
+                leader = False
+            else:
+                # Either nothing is open or it can't take us: start a new one
+                # (the old leader keeps its reference and sends it as is).
+                batch = self._open = _Batch(request)
+                leader = True
+
+        if not leader:
+            # The leader's call is bounded by the HTTP timeout; don't outwait it.
+            request.done.wait(self._window + _TIMEOUT_SEC + 1)
+            return request.answer
+
+        batch.full.wait(self._window)
+        with self._lock:
+            if self._open is batch:
+                self._open = None
+        answers: List[Optional[Dict[str, Any]]] = []
+        try:
+            answers = self._send(batch.requests)
+        finally:
+            for waiting, answer in zip(batch.requests, answers or [None] * len(batch.requests)):
+                waiting.answer = answer
+                waiting.done.set()
+        return request.answer
+
+
+_BATCHER = _Batcher(_ask_model, _BATCH_WINDOW_SEC, _BATCH_MAX_ITEMS, _BATCH_MAX_CHARS)
 
 
 def estimate_complexity(ir: Dict[str, Any]) -> str:
     """Heuristic Big-O from the deepest nesting of loops in the IR.
 
-    This is the fallback when the model is unavailable, and a sanity check
-    otherwise. It counts how many loops are nested inside each other.
+    The original, nesting-only estimate; `complexity.analyze` supersedes it
+    for the insights but this stays as a cheap, dependency-free reference.
+    It counts how many loops are nested inside each other.
     """
     def depth(node: Dict[str, Any]) -> int:
         children: List[Dict[str, Any]] = []
@@ -118,27 +299,43 @@ def estimate_complexity(ir: Dict[str, Any]) -> str:
     return f"O(n^{loops}) — {loops} levels of nested loops"
 
 
-def generate_insights(code: str, steps: List[Dict[str, Any]], ir: Dict[str, Any]) -> Dict[str, Any]:
-    """Return {summary, complexity, ai} - AI-written when possible, heuristic
-    otherwise. Always returns something usable."""
-    fallback = {
-        "summary": "",
-        "complexity": estimate_complexity(ir),
+def heuristic_insights(ir: Dict[str, Any], analysis: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """The no-model answer from the static analyzer: used when the model fails,
+    is deliberately skipped (e.g. the endpoint is shedding load), or isn't
+    needed because the analysis is confident."""
+    analysis = analysis or complexity.analyze(ir)
+    return {
+        "summary": analysis["summary"],
+        "complexity": analysis["complexity"],
         "ai": False,
     }
 
-    prompt = _build_prompt(code, steps)
-    gemini_key = os.getenv("GEMINI_API_KEY")
 
-    try:
-        data = _call_gemini(prompt, gemini_key) if gemini_key else _call_pollinations(prompt)
-    except Exception:
-        # Network/timeout/parse issues should never surface to the user - we
-        # simply fall back to the deterministic estimate.
+def shed_insights(ir: Dict[str, Any]) -> Dict[str, Any]:
+    """The answer when the model stage is too busy to ask: the heuristic,
+    flagged as a `fallback` unless the static analysis would have settled the
+    question without the model anyway."""
+    analysis = complexity.analyze(ir)
+    insights = heuristic_insights(ir, analysis)
+    if analysis["confidence"] < _STATIC_CONFIDENCE:
+        insights["fallback"] = True
+    return insights
+
+
+def generate_insights(code: str, steps: List[Dict[str, Any]], ir: Dict[str, Any]) -> Dict[str, Any]:
+    """Return {summary, complexity, ai} - AI-written when possible, heuristic
+    otherwise, with `fallback` set when the model was wanted but failed.
+    Always returns something usable."""
+    analysis = complexity.analyze(ir)
+    fallback = heuristic_insights(ir, analysis)
+    if analysis["confidence"] >= _STATIC_CONFIDENCE:
+        # The Big-O is settled without the network; that's most snippets.
         return fallback
 
+    data = _BATCHER.ask(code, steps)
     if not data:
-        return fallback
+        # Flagged so the handler doesn't let clients cache this stand-in.
+        return {**fallback, "fallback": True}
 
     return {
         "summary": str(data.get("summary", "")).strip(),
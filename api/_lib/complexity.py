@@ -0,0 +1,755 @@
+"""Deterministic, interprocedural Big-O analysis over the IR.
+
+`ai.estimate_complexity` only counts loop nesting. This analyzer goes further,
+still without calling out to anything:
+
+- every function gets its own cost, and a call to a local function inside a
+  loop costs that function's cost per iteration (a small call graph, memoised);
+- common library calls are priced (`sorted` is n log n, `sum` / `x in list` /
+  slicing are linear, `len` / dict lookups are constant);
+- comprehensions and the callbacks of `map` / `filter` / `sorted(key=...)` /
+  `forEach` and friends run once per item, so their insides cost that much
+  more: `[x for x in xs if xs.count(x) > 1]` is quadratic;
+- loops that shrink or grow geometrically (`x //= 2`, `i *= 3`, `lo = mid + 1`)
+  are logarithmic, and loops over a literal `range(10)` are constant;
+- direct recursion is solved with the usual recurrences: one halving call is
+  log n, two halving calls with linear work is n log n (merge sort), one
+  decrementing call is linear, two are exponential (naive Fibonacci).
+
+Each result carries a confidence in [0, 1]. Anything the IR can't show us
+(class bodies, unknown helpers, `while True`, recursion with odd arguments)
+lowers it, and `ai.generate_insights` only trusts the result without a model
+call when the confidence is high.
+
+Costs are `n^poly * log^log n`, or `base^n` when `exp` is set; ordering them as
+plain tuples gives the right "which one dominates" comparison.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+
+class Cost(NamedTuple):
+    exp: int  # 0 for polynomial, otherwise the base of an exponential.
+    poly: int
+    log: int
+
+
+ONE = Cost(0, 0, 0)
+LOG = Cost(0, 0, 1)
+N = Cost(0, 1, 0)
+N_LOG_N = Cost(0, 1, 1)
+
+
+def _times(a: Cost, b: Cost) -> Cost:
+    return Cost(max(a.exp, b.exp), a.poly + b.poly, a.log + b.log)
+
+
+def big_o(cost: Cost) -> str:
+    """Render a cost as Big-O notation, e.g. `O(n log n)`."""
+    if cost.exp:
+        return f"O({cost.exp}^n)"
+    parts = []
+    if cost.poly:
+        parts.append("n" if cost.poly == 1 else f"n^{cost.poly}")
+    if cost.log:
+        parts.append("log n" if cost.log == 1 else f"log^{cost.log} n")
+    return f"O({' '.join(parts) or '1'})"
+
+
+def _reason(cost: Cost) -> str:
+    if cost.exp:
+        return "branching recursion"
+    if cost == ONE:
+        return "no input-dependent loops"
+    if cost == LOG:
+        return "the input halves each step"
+    if cost == N:
+        return "single pass over the input"
+    if cost == N_LOG_N:
+        return "sorting or divide-and-conquer"
+    if cost.poly == 2 and not cost.log:
+        return "nested passes over the input"
+    if not cost.log:
+        return f"{cost.poly} levels of nested passes"
+    return "nested passes with a logarithmic factor"
+
+
+# Library calls by cost. Names are matched on the last dotted segment, so
+# `arr.sort` and `sorted` both land in the n log n bucket.
+_N_LOG_N_CALLS = {"sorted", "sort", "nlargest", "nsmallest"}
+_LINEAR_CALLS = {
+    "sum", "min", "max", "any", "all", "reversed", "join", "index", "count",
+    "remove", "insert", "copy", "deepcopy", "extend", "Counter", "deque", "heapify",
+    "bytes", "bytearray", "split", "replace",
+    # JS / TS
+    "indexOf", "lastIndexOf", "includes", "slice", "splice", "concat", "map",
+    "filter", "reduce", "forEach", "find", "findIndex", "some", "every", "fill",
+    "reverse", "from", "unshift", "shift", "stringify", "parse",
+}
+_CONSTANT_CALLS = {
+    "print", "len", "abs", "int", "float", "bool", "range", "enumerate", "zip",
+    "append", "add", "get", "pop", "discard", "update", "setdefault", "isinstance",
+    "hash", "id", "ord", "chr", "round", "divmod", "pow", "type", "iter", "next",
+    "heappush", "heappop", "appendleft", "popleft", "defaultdict", "super", "format",
+    "lower", "upper", "strip", "startswith", "endswith", "isdigit", "isalpha", "str",
+    "items", "keys", "values", "entries",
+    # JS / TS
+    "log", "error", "warn", "push", "has", "set", "delete", "floor", "ceil", "sqrt",
+    "random", "charAt", "charCodeAt", "toString", "parseInt", "parseFloat", "Number",
+    "String", "Boolean", "isArray",
+}
+# Builtin constructors copy their argument: `list(xs)` is linear, `list()` isn't.
+_COPYING_CONSTRUCTORS = {"list", "set", "dict", "tuple", "frozenset"}
+
+# `{` opens a dict/set literal in Python and an object literal in JS: all hashed.
+_HASH_VALUE = re.compile(r"^(?:\{|(?:dict|set|defaultdict|Counter|frozenset)\(|new (?:Set|Map)\()")
+_LIST_VALUE = re.compile(r"^(?:\[|list\(|new Array\(|Array\()")
+
+# Every pattern that scans free-form expression text must stay linear however
+# the text is crafted: each can start at only a few places (never mid-name), and
+# no quantifier can trade characters with the one after it.
+#
+# A call site: a possibly dotted name followed by "(". It may follow `).` or
+# `].` (`sorted(xs).index(y)`) but never start inside a name or a dotted chain.
+_CALL = re.compile(r"(?<![\w$])(?<![\w$]\.)([A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*)\s*\(")
+_COMP_FOR = re.compile(r"\bfor\s+[\w$, ()]{1,200}?\s+in\s+")
+_MEMBERSHIP = re.compile(r"\bin\s+([A-Za-z_$][\w$]*)\b(?!\s*[.(\[])")
+_SLICE = re.compile(r"\[[^\[\]{}:]*:[^\[\]{}]*\]|\.slice\(")
+# Calls that run a function argument per item, and how often that is in all. A
+# sort calls its comparator n log n times but a `key=` function once per item.
+# Which argument is the callback is settled in `_Analyzer._callbacks`.
+_CALLBACK_CALLS = {
+    "map": N, "filter": N, "min": N, "max": N, "sorted": N_LOG_N, "sort": N_LOG_N,
+    # JS / TS
+    "forEach": N, "reduce": N, "reduceRight": N, "some": N, "every": N, "find": N,
+    "findIndex": N, "findLast": N, "findLastIndex": N, "flatMap": N,
+}
+_FUNCTION_LITERAL = re.compile(r"\blambda\b|=>|\bfunction\b")
+# A callback passed by name, e.g. `map(str, xs)` or `key=len`.
+_CALLBACK_NAME = re.compile(r"\s*(?:key\s*=(?!=)\s*)?([A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*)\s*")
+_KEY_ARG = re.compile(r"\s*key\s*=(?!=)")
+_COMP_IF = re.compile(r"\bif\b")
+
+# String literals (closed or not) and brackets, for the one pass in `_scan`.
+_TOKEN = re.compile(r"""[()\[\]{},]|"(?:[^"\\\n]|\\.)*"?|'(?:[^'\\\n]|\\.)*'?|`(?:[^`\\]|\\.)*`?""")
+
+# Longer expressions are analyzed up to here (and trusted less).
+_MAX_EXPR_CHARS = 4000
+_CONST_RANGE = re.compile(r"^range\(\s*-?\d+\s*(?:,\s*-?\d+\s*){0,2}\)$")
+_LITERAL_BOUND = re.compile(r"^\s*[\w$.]+\s*(?:<|<=|>|>=|!=)\s*-?\d+\s*$")
+
+# Loop updates that shrink/grow the range geometrically.
+_HALVING_OPS = {"FloorDiv", "Div", "RShift", "Mult", "LShift"}
+_SHIFT_OPS = {"RShift", "LShift"}
+# Multiplying or dividing by a literal: `x // 3`, `i * 2`, `n >> 1`.
+_SCALING = re.compile(r"(//|/|\*|>>>?|<<)\s*(\d+)\b")
+_INT_LITERAL = re.compile(r"\s*(\d+)\s*;?\s*")
+# The update clause of a C-style JS loop, one comma-separated part at a time.
+_STEP_INC = re.compile(r"\s*(?:(?:\+\+|--)\s*[\w$.]+|[\w$.]+\s*(?:\+\+|--))\s*")
+_STEP_AUG = re.compile(r"\s*[\w$.]+\s*(\*\*|\*|/|>>>|>>|<<|\+|-)=(.*)")
+_STEP_ASSIGN = re.compile(r"\s*[\w$.]+\s*=(?!=)(.*)")
+_STEP_OPS = {"*": "Mult", "**": "Mult", "/": "Div", ">>": "RShift", ">>>": "RShift", "<<": "LShift"}
+_BOUND_NAMES = {"lo", "hi", "low", "high", "left", "right", "l", "r", "start", "end"}
+
+_HALVING_ARG = re.compile(r"//|/\s*2|>>\s*1|\bmid\b|\bhalf\b")
+_DECREMENT_ARG = re.compile(r"[-+]\s*\d|\[\s*1\s*:|\.slice\(\s*1|\bnext\b|\brest\b|\btail\b")
+
+# Statement kinds whose insides the IR doesn't model (kept as raw text).
+_OPAQUE_KINDS = {"ClassDef", "AsyncFunctionDef", "AsyncFor", "AsyncWith", "Match", "TryStar"}
+
+
+def _scan(text: str) -> Tuple[str, Dict[int, int], Dict[int, List[int]]]:
+    """One pass over an expression: (text with string literals blanked out,
+    each opening bracket's partner, the commas directly inside each opening).
+
+    Blanking keeps offsets and stops `for` / `in` / `f(` inside strings from
+    being read as code. An unclosed bracket is partnered with the end.
+    """
+    out: List[str] = []
+    partners: Dict[int, int] = {}
+    commas: Dict[int, List[int]] = {}
+    stack: List[int] = []
+    last = 0
+    for tok in _TOKEN.finditer(text):
+        start, end = tok.span()
+        ch = text[start]
+        if ch in "\"'`":
+            out.append(text[last:start + 1])
+            out.append(" " * (end - start - 2) + text[end - 1] if end - start > 1 else "")
+            last = end
+        elif ch in "([{":
+            stack.append(start)
+        elif ch == ",":
+            if stack:
+                commas.setdefault(stack[-1], []).append(start)
+        elif stack:
+            partners[stack.pop()] = start
+    out.append(text[last:])
+    for start in stack:
+        partners[start] = len(text)
+    return "".join(out), partners, commas
+
+
+def _enclosing(partners: Dict[int, int], length: int) -> List[int]:
+    """For each offset, the opening bracket it sits directly inside (-1 for
+    none). Brackets are only known through `partners`, because `expr` blanks
+    some of them out of the text it matches against."""
+    enclosing: List[int] = []
+    stack: List[int] = []
+    for i in range(length):
+        while stack and i >= partners[stack[-1]]:
+            stack.pop()
+        enclosing.append(stack[-1] if stack else -1)
+        if i in partners:
+            stack.append(i)
+    return enclosing
+
+
+def _scales(text: str) -> bool:
+    """Whether `text` multiplies or divides by a literal factor that changes
+    the value geometrically (2 or more, or any shift)."""
+    for m in _SCALING.finditer(text):
+        digits = m.group(2).lstrip("0")
+        if len(digits) > 1 or digits >= ("1" if m.group(1) in (">>", ">>>", "<<") else "2"):
+            return True
+    return False
+
+
+def _geometric_update(op: str, value: str) -> bool:
+    """`x op= value` with op in _HALVING_OPS: geometric unless the factor is a
+    literal that leaves x where it was (`x *= 1`, `x //= 1`, `x >>= 0`)."""
+    m = _INT_LITERAL.fullmatch(value or "")
+    if m is None:
+        return True  # a variable factor: trust the operator
+    digits = m.group(1).lstrip("0")
+    return len(digits) > 1 or digits >= ("1" if op in _SHIFT_OPS else "2")
+
+
+def _always_returns(stmts: Optional[List[Dict[str, Any]]]) -> bool:
+    """Whether every path through `stmts` ends in a return or raise."""
+    if not stmts:
+        return False
+    last = stmts[-1]
+    kind = last.get("kind")
+    if kind in ("Return", "Raise"):
+        return True
+    if kind == "If":
+        return _always_returns(last.get("body")) and _always_returns(last.get("orelse"))
+    return False
+
+
+class _Frame:
+    """Per-function walk state."""
+
+    def __init__(self, name: Optional[str]) -> None:
+        self.name = name
+        self.types: Dict[str, str] = {}  # variable -> "hash" | "list"
+        # Argument text of each self-call, and whether any sat inside a loop.
+        self.self_calls: List[str] = []
+        self.self_call_in_loop = False
+
+
+class _Analyzer:
+    def __init__(self, ir: Dict[str, Any]) -> None:
+        self.functions: Dict[str, Dict[str, Any]] = {}
+        self._collect(ir.get("body", []))
+        self.costs: Dict[str, Cost] = {}
+        self.in_progress: Set[str] = set()
+        self.confidence = 1.0
+        self._penalised: Set[Tuple[str, str]] = set()
+
+    def _collect(self, stmts: List[Dict[str, Any]]) -> None:
+        for stmt in stmts or []:
+            if stmt.get("kind") == "FunctionDef" and stmt.get("name"):
+                self.functions[stmt["name"]] = stmt
+            for key in ("body", "orelse", "finalbody"):
+                self._collect(stmt.get(key) or [])
+            for handler in stmt.get("handlers") or []:
+                self._collect(handler.get("body") or [])
+
+    def penalise(self, factor: float, why: str, what: str = "") -> None:
+        """Lower confidence once per distinct (reason, subject)."""
+        if (why, what) not in self._penalised:
+            self._penalised.add((why, what))
+            self.confidence *= factor
+
+    # -- functions ---------------------------------------------------------
+
+    def function_cost(self, name: str) -> Cost:
+        if name in self.costs:
+            return self.costs[name]
+        if name in self.in_progress:
+            # Mutual recursion: we can't solve it, so count the call as one
+            # step and say so through the confidence.
+            self.penalise(0.6, "mutual recursion", name)
+            return ONE
+        self.in_progress.add(name)
+        fn = self.functions[name]
+        frame = _Frame(name)
+        work, calls = self.block(fn.get("body", []), frame)
+        cost = self._solve_recursion(work, calls, frame)
+        self.in_progress.discard(name)
+        self.costs[name] = cost
+        return cost
+
+    def _solve_recursion(self, work: Cost, calls: int, frame: _Frame) -> Cost:
+        """Close T(n) = calls * T(shrunk n) + work for direct recursion."""
+        if not calls:
+            return work
+        if frame.self_call_in_loop:
+            # Backtracking / permutations look like this, but so does a DFS
+            # with a visited set - leave the verdict to the model.
+            self.penalise(0.5, "recursion inside a loop", frame.name or "")
+            return Cost(2, 0, 0)
+
+        halving = all(_HALVING_ARG.search(a) for a in frame.self_calls)
+        decrementing = all(_DECREMENT_ARG.search(a) for a in frame.self_calls)
+        if not (halving or decrementing):
+            self.penalise(0.6, "unrecognised recursion", frame.name or "")
+
+        if halving:
+            # Master theorem with b = 2: compare work against n^log2(calls).
+            if calls == 1:
+                return Cost(0, 0, work.log + 1) if work.poly == 0 else work
+            if calls == 2:
+                if work.poly < 1:
+                    return N
+                if work.poly == 1:
+                    return Cost(0, 1, work.log + 1)
+                return work
+            critical = (calls - 1).bit_length()
+            if calls != 1 << critical:
+                self.penalise(0.7, "irregular divide-and-conquer", frame.name or "")
+            return max(work, Cost(0, critical, 0))
+
+        if calls == 1:
+            return _times(N, work)
+        return Cost(calls, 0, 0)
+
+    # -- statements --------------------------------------------------------
+
+    def block(self, stmts: List[Dict[str, Any]], frame: _Frame) -> Tuple[Cost, int]:
+        """Cost of running `stmts` in sequence, plus the most self-calls made
+        on any one path through them.
+
+        An `if` branch that returns ends its path, so the statements after it
+        are the other branch: `if a[mid] < t: return bs(..)` followed by
+        `return bs(..)` is one call per invocation, not two.
+        """
+        cost, calls = ONE, 0
+        returned = 0  # most self-calls on a path that already returned
+        for stmt in stmts or []:
+            if stmt.get("kind") == "If":
+                then_returns = _always_returns(stmt.get("body"))
+                else_returns = _always_returns(stmt.get("orelse"))
+                if then_returns or else_returns:
+                    test, k0 = self.expr(stmt.get("test"), frame)
+                    then, k1 = self.block(stmt.get("body", []), frame)
+                    other, k2 = self.block(stmt.get("orelse", []), frame)
+                    cost, calls = max(cost, test, then, other), calls + k0
+                    if then_returns:
+                        returned = max(returned, calls + k1)
+                    if else_returns:
+                        returned = max(returned, calls + k2)
+                    if then_returns and else_returns:
+                        return cost, returned  # nothing after this runs
+                    calls += k2 if then_returns else k1
+                    continue
+            c, k = self.stmt(stmt, frame)
+            cost = max(cost, c)
+            calls += k
+        return cost, max(calls, returned)
+
+    def stmt(self, node: Dict[str, Any], frame: _Frame) -> Tuple[Cost, int]:
+        kind = node.get("kind")
+
+        if kind == "FunctionDef":
+            # Defining a function costs nothing; calling it is priced at the
+            # call site via `function_cost`.
+            return ONE, 0
+
+        if kind == "For":
+            return self._for(node, frame)
+
+        if kind == "While":
+            return self._while(node, frame)
+
+        if kind == "If":
+            test, k0 = self.expr(node.get("test"), frame)
+            then, k1 = self.block(node.get("body", []), frame)
+            other, k2 = self.block(node.get("orelse", []), frame)
+            # Only one branch runs, so only one branch's self-calls count.
+            return max(test, then, other), k0 + max(k1, k2)
+
+        if kind == "Try":
+            cost, calls = self.block(node.get("body", []), frame)
+            for handler in node.get("handlers") or []:
+                c, k = self.block(handler.get("body", []), frame)
+                cost, calls = max(cost, c), calls + k
+            for key in ("orelse", "finalbody"):
+                c, k = self.block(node.get(key, []), frame)
+                cost, calls = max(cost, c), calls + k
+            return cost, calls
+
+        if kind == "With":
+            cost, calls = ONE, 0
+            for item in node.get("items") or []:
+                c, k = self.expr(item.get("context_expr"), frame)
+                cost, calls = max(cost, c), calls + k
+            c, k = self.block(node.get("body", []), frame)
+            return max(cost, c), calls + k
+
+        if kind in ("Assign", "AnnAssign"):
+            value = node.get("value") or ""
+            targets = node.get("targets") or [node.get("target") or ""]
+            for target in targets:
+                if _HASH_VALUE.match(value):
+                    frame.types[target] = "hash"
+                elif _LIST_VALUE.match(value):
+                    frame.types[target] = "list"
+            return self.expr(value, frame)
+
+        if kind == "AugAssign":
+            return self.expr(node.get("value"), frame)
+
+        if kind == "Return":
+            return self.expr(node.get("value"), frame)
+
+        if kind == "Call":
+            args = list(node.get("args") or [])
+            args += [f"{kw['arg']}={kw.get('value', '')}" if kw.get("arg") else f"**{kw.get('value', '')}"
+                     for kw in node.get("keywords") or []]
+            return self.expr(f"{node.get('func', '')}({', '.join(args)})", frame)
+
+        if kind == "Expr":
+            return self.expr(node.get("expr"), frame)
+
+        if kind in _OPAQUE_KINDS:
+            self.penalise(0.5, "unmodelled construct", kind)
+        return ONE, 0
+
+    def _for(self, node: Dict[str, Any], frame: _Frame) -> Tuple[Cost, int]:
+        it = (node.get("iter") or "").strip()
+        setup, calls = self.expr(it, frame)
+        if not node.get("target"):
+            # C-style JS loop: `iter` is the continue condition.
+            trips = ONE if _LITERAL_BOUND.match(it) else self._c_style_trips(it, node.get("step"))
+        elif _CONST_RANGE.match(it):
+            trips = ONE
+        else:
+            trips = N
+        body, k = self.block(node.get("body", []), frame)
+        if k:
+            frame.self_call_in_loop = True
+        return max(setup, _times(trips, body)), calls + k
+
+    def _c_style_trips(self, cond: str, step: Optional[str]) -> Cost:
+        """Trips of `for (...; cond; step)`, read off the update clause."""
+        linear = bool(step)
+        for part in (step or "").split(","):
+            if _STEP_INC.fullmatch(part):
+                continue
+            m = _STEP_AUG.fullmatch(part)
+            if m and m.group(1) in _STEP_OPS:
+                if _geometric_update(_STEP_OPS[m.group(1)], m.group(2)):
+                    return LOG
+                linear = False  # `i *= 1` never gets anywhere
+                continue
+            if m:  # += / -=
+                continue
+            m = _STEP_ASSIGN.fullmatch(part)
+            if m and _scales(m.group(1)):
+                return LOG
+            if not (m and re.search(r"[-+]", m.group(1))):
+                linear = False
+        if not linear:
+            # A step we can't read (or none at all) could be anything.
+            self.penalise(0.8, "unrecognised loop step", step or cond)
+        return N
+
+    def _while(self, node: Dict[str, Any], frame: _Frame) -> Tuple[Cost, int]:
+        test = (node.get("test") or "").strip()
+        setup, calls = self.expr(test, frame)
+        body_nodes = node.get("body", [])
+        if self._halves(test, body_nodes):
+            trips = LOG
+        else:
+            trips = N
+            if test in ("True", "true", "1"):
+                self.penalise(0.7, "unbounded while loop", test)
+            elif not self._steps_linearly(test, body_nodes):
+                self.penalise(0.8, "unrecognised while bound", test)
+        body, k = self.block(body_nodes, frame)
+        if k:
+            frame.self_call_in_loop = True
+        return max(setup, _times(trips, body)), calls + k
+
+    def _loop_updates(self, body: List[Dict[str, Any]]):
+        """Every assignment in a loop body (including under ifs), not nested loops."""
+        for stmt in body or []:
+            kind = stmt.get("kind")
+            if kind in ("Assign", "AugAssign"):
+                yield stmt
+            elif kind in ("If", "Try", "With"):
+                yield from self._loop_updates(stmt.get("body", []))
+                yield from self._loop_updates(stmt.get("orelse", []))
+
+    def _halves(self, test: str, body: List[Dict[str, Any]]) -> bool:
+        names = set(re.findall(r"[A-Za-z_$][\w$]*", test))
+        for upd in self._loop_updates(body):
+            if upd.get("kind") == "AugAssign":
+                op = upd.get("op")
+                if upd.get("target") in names and op in _HALVING_OPS and _geometric_update(op, upd.get("value")):
+                    return True
+                continue
+            value = upd.get("value") or ""
+            for target in upd.get("targets") or []:
+                if target not in names:
+                    continue
+                if _scales(value):
+                    return True
+                if target in _BOUND_NAMES and re.search(r"\bmid\b", value):
+                    return True
+        return False
+
+    def _steps_linearly(self, test: str, body: List[Dict[str, Any]]) -> bool:
+        names = set(re.findall(r"[A-Za-z_$][\w$]*", test))
+        for upd in self._loop_updates(body):
+            if upd.get("kind") == "AugAssign" and upd.get("target") in names:
+                return True
+            if upd.get("kind") == "Assign" and names & set(upd.get("targets") or []):
+                return True
+            # Draining a collection: `while stack: stack.pop()`.
+        for stmt in body or []:
+            if stmt.get("kind") == "Call" and any(
+                    (stmt.get("func") or "").startswith(n + ".") for n in names):
+                return True
+            value = stmt.get("value") or ""
+            if any(f"{n}.pop" in value or f"{n}.popleft" in value for n in names):
+                return True
+        return False
+
+    # -- expressions -------------------------------------------------------
+
+    def expr(self, text: Optional[str], frame: _Frame) -> Tuple[Cost, int]:
+        """Cost of evaluating one expression string, plus self-calls in it.
+
+        Everything inside a comprehension or a per-item callback is priced
+        times the number of items: see `_loop_regions`.
+        """
+        if not text:
+            return ONE, 0
+        cost, calls = ONE, 0
+        if len(text) > _MAX_EXPR_CHARS:
+            self.penalise(0.7, "expression too long", text[:40])
+            text = text[:_MAX_EXPR_CHARS]
+        text, partners, commas = _scan(text)
+        enclosing = _enclosing(partners, len(text))
+        heads = list(_COMP_FOR.finditer(text))
+        # Blank the comprehension heads out without moving anything, so the
+        # bracket positions from `_scan` still hold.
+        bare = _COMP_FOR.sub(lambda m: " " * len(m.group(0)), text)
+        calls_at = [(m, m.group(1)) for m in _CALL.finditer(bare)]
+
+        # How many times the code at each offset runs per evaluation, as
+        # running sums of (poly, log) steps.
+        step_poly = [0] * (len(bare) + 1)
+        step_log = [0] * (len(bare) + 1)
+
+        def region(begin: int, end: int, times: Cost) -> None:
+            step_poly[begin] += times.poly
+            step_poly[end] -= times.poly
+            step_log[begin] += times.log
+            step_log[end] -= times.log
+
+        self._comprehensions(bare, heads, partners, enclosing, region)
+        named = self._callbacks(bare, calls_at, partners, commas, enclosing, region)
+
+        depth: List[Cost] = []
+        poly = log = 0
+        for i in range(len(bare)):
+            poly += step_poly[i]
+            log += step_log[i]
+            depth.append(Cost(0, poly, log))
+        if depth:
+            cost = max(cost, max(depth))  # building the result or just looping
+
+        def at(pos: int, work: Cost) -> Cost:
+            return _times(depth[pos], work)
+
+        for match in _MEMBERSHIP.finditer(bare):
+            var = match.group(1)
+            kind = frame.types.get(var)
+            if kind == "hash" or var in ("range",):
+                continue
+            if kind is None:
+                # Probably a list parameter, but it could be a dict or set.
+                self.penalise(0.85, "membership on unknown type", var)
+            cost = max(cost, at(match.start(), N))
+
+        for match in _SLICE.finditer(bare):
+            cost = max(cost, at(match.start(), N))
+
+        for pos, full, times in named:
+            # A function passed by name runs once per item.
+            name = full.rsplit(".", 1)[-1]
+            local = full if full in self.functions else (
+                name if full.startswith(("self.", "this.")) and name in self.functions else None)
+            if local is not None and local == frame.name:
+                calls += 1
+                frame.self_calls.append("")
+                frame.self_call_in_loop = True
+            elif local is not None:
+                cost = max(cost, at(pos, _times(times, self.function_cost(local))))
+            elif name not in _CONSTANT_CALLS and name not in _COPYING_CONSTRUCTORS and name != "None":
+                self.penalise(0.8, "unknown callback", name)
+
+        for match, full in calls_at:
+            name = full.rsplit(".", 1)[-1]
+            opened = match.end() - 1
+            args = bare[opened + 1:partners.get(opened, len(bare))].strip()
+            local = full if full in self.functions else (
+                name if full.startswith(("self.", "this.")) and name in self.functions else None)
+
+            if local is not None and local == frame.name:
+                calls += 1
+                frame.self_calls.append(args)
+                if depth[match.start()] != ONE:
+                    frame.self_call_in_loop = True
+                continue
+            if local is not None:
+                cost = max(cost, at(match.start(), self.function_cost(local)))
+            elif name in _N_LOG_N_CALLS:
+                cost = max(cost, at(match.start(), N_LOG_N))
+            elif full == name and name in _COPYING_CONSTRUCTORS:
+                if args:
+                    cost = max(cost, at(match.start(), N))
+            elif name == "pop" and args == "0":
+                # Popping the front shifts every remaining element.
+                cost = max(cost, at(match.start(), N))
+            elif (name in ("min", "max") and opened in commas
+                  and not any(_KEY_ARG.match(bare, c + 1) for c in commas[opened])):
+                continue  # max(a, b) compares scalars; max(xs) scans
+            elif name in _LINEAR_CALLS:
+                cost = max(cost, at(match.start(), N))
+            elif name not in _CONSTANT_CALLS:
+                # Enough on its own to send the question to the model: an
+                # unknown library call can cost anything.
+                self.penalise(0.8, "unknown call", name)
+        return cost, calls
+
+    def _comprehensions(self, bare: str, heads, partners: Dict[int, int],
+                        enclosing: List[int], region: Callable[[int, int, Cost], None]) -> None:
+        """Mark what runs per item in each comprehension.
+
+        With k `for` clauses the element runs n^k times, the j-th clause's
+        iterable n^(j-1) times, and the `if`s after it n^j times.
+        """
+        by_bracket: Dict[int, List[Any]] = {}
+        for head in heads:
+            by_bracket.setdefault(enclosing[head.start()], []).append(head)
+        ifs: Dict[int, List[int]] = {}
+        for match in _COMP_IF.finditer(bare):
+            owner = enclosing[match.start()]
+            if owner in by_bracket:
+                ifs.setdefault(owner, []).append(match.start())
+        for opened, clauses in by_bracket.items():
+            closed = partners.get(opened, len(bare)) if opened >= 0 else len(bare)
+            region(opened + 1, clauses[0].start(), Cost(0, len(clauses), 0))
+            conditions = iter(ifs.get(opened, []))
+            cond = next(conditions, closed)
+            for j, head in enumerate(clauses):
+                stop = clauses[j + 1].start() if j + 1 < len(clauses) else closed
+                while cond < head.end():
+                    cond = next(conditions, closed)
+                iterable_end = min(cond, stop)
+                region(head.end(), iterable_end, Cost(0, j, 0))
+                region(iterable_end, stop, Cost(0, j + 1, 0))
+
+    def _callbacks(self, bare: str, calls_at, partners: Dict[int, int], commas: Dict[int, List[int]],
+                   enclosing: List[int], region: Callable[[int, int, Cost], None]) -> List[Tuple[int, str, Cost]]:
+        """Mark the function literals passed to per-item calls, and return the
+        functions passed by name as (offset, name, times called)."""
+        callers: Dict[int, Tuple[str, str]] = {}
+        for match, full in calls_at:
+            name = full.rsplit(".", 1)[-1]
+            if name in _CALLBACK_CALLS:
+                callers[match.end() - 1] = (full, name)
+
+        def argument(opened: int, pos: int) -> Tuple[int, int]:
+            begin, end = opened + 1, partners.get(opened, len(bare))
+            for comma in commas.get(opened, []):
+                if comma < pos:
+                    begin = comma + 1
+                else:
+                    end = comma
+                    break
+            return begin, end
+
+        def times(opened: int, begin: int) -> Cost:
+            return N if _KEY_ARG.match(bare, begin) else _CALLBACK_CALLS[callers[opened][1]]
+
+        marked: Set[Tuple[int, int]] = set()
+        for match in _FUNCTION_LITERAL.finditer(bare):
+            opened = enclosing[match.start()]
+            if opened not in callers:
+                continue
+            span = argument(opened, match.start())
+            if span not in marked:
+                marked.add(span)
+                region(span[0], span[1], times(opened, span[0]))
+
+        named: List[Tuple[int, str, Cost]] = []
+        for opened, (full, name) in callers.items():
+            # `key=` for sorts and min/max; otherwise the first argument
+            # (`map(f, xs)`, `xs.filter(f)`, `xs.sort(cmp)`).
+            positions = [begin for begin in [opened + 1] + [c + 1 for c in commas.get(opened, [])]
+                         if _KEY_ARG.match(bare, begin)]
+            if name not in ("min", "max", "sorted"):
+                positions.insert(0, opened + 1)
+            for begin in positions:
+                end = argument(opened, begin)[1]
+                if (begin, end) in marked:
+                    continue
+                m = _CALLBACK_NAME.fullmatch(bare, begin, end)
+                if m is not None:
+                    named.append((begin, m.group(1), times(opened, begin)))
+        return named
+
+
+def analyze(ir: Dict[str, Any]) -> Dict[str, Any]:
+    """Analyze a module IR.
+
+    Returns `{complexity, big_o, confidence, functions, summary}` where
+    `complexity` is "O(...) — reason" like `ai.estimate_complexity`, and
+    `functions` maps each function name to its own Big-O.
+    """
+    analyzer = _Analyzer(ir)
+    for name in analyzer.functions:
+        analyzer.function_cost(name)
+
+    # Module-level code, plus every function as if it were called: the user
+    # asked about all of the code they pasted.
+    top, _ = analyzer.block(ir.get("body", []), _Frame(None))
+    overall = max([top, *analyzer.costs.values()])
+
+    top_fns = [s for s in ir.get("body", []) if s.get("kind") == "FunctionDef" and s.get("name")]
+    if top_fns:
+        described = "; ".join(
+            f"{fn['name']}({', '.join(fn.get('args', []))}) runs in {big_o(analyzer.costs[fn['name']])}"
+            for fn in top_fns[:5])
+        count = f"{len(top_fns)} function{'s' if len(top_fns) != 1 else ''}"
+        summary = f"Defines {count}. {described}."
+    else:
+        summary = f"A top-level script that runs in {big_o(overall)}."
+
+    return {
+        "complexity": f"{big_o(overall)} — {_reason(overall)}",
+        "big_o": big_o(overall),
+        "confidence": round(analyzer.confidence, 3),
+        "functions": {name: big_o(cost) for name, cost in analyzer.costs.items()},
+        "summary": summary,
+    }
@@ -5,11 +5,15 @@ should point at, and the last node that flows onward. Blocks are stitched by
 connecting each statement's tail to the next statement's head, so decisions
 (if / loops) fan out with labelled edges and rejoin cleanly without the
 duplicate edges you'd get from naively chaining every node.
+
+The walkers are generators: they yield diagram lines as soon as they are
+written and hand their span back as the generator's return value, so
+`iter_mermaid` can stream a large diagram without holding all of it.
 """
 
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Generator, Iterator, List, Optional, Tuple
 
 _AUG_SYMBOL = {
     "add": "+=", "sub": "-=", "mult": "*=", "div": "/=", "truediv": "/=",
@@ -19,6 +23,8 @@ _AUG_SYMBOL = {
 
 # A node walker yields the entry node id and the exit node id of a statement.
 Span = Tuple[str, str]
+# ...by way of a generator that yields diagram lines and returns that span.
+Walk = Generator[str, None, Optional[Span]]
 
 
 def _clean(value: Any) -> str:
@@ -30,9 +36,14 @@ def _clean(value: Any) -> str:
 
 class _Builder:
     def __init__(self) -> None:
+        # Lines written since the last `drain()`; only ever a handful.
         self.lines: List[str] = ["flowchart TD"]
         self._n = 0
 
+    def drain(self) -> List[str]:
+        pending, self.lines = self.lines, []
+        return pending
+
     def _id(self) -> str:
         self._n += 1
         return f"N{self._n}"
@@ -51,15 +62,16 @@ class _Builder:
         self.lines.append(f"{a} -->|{_clean(label)}| {b}" if label else f"{a} --> {b}")
 
 
-def ir_to_mermaid(ir: Dict[str, Any]) -> str:
+def iter_mermaid(ir: Dict[str, Any]) -> Iterator[str]:
+    """Yield the Mermaid flowchart for `ir` line by line, as it's built."""
     b = _Builder()
 
-    def walk_block(children: List[Dict[str, Any]]) -> Optional[Span]:
+    def walk_block(children: List[Dict[str, Any]]) -> Walk:
         """Wire a list of statements in sequence and return the block's span."""
         head: Optional[str] = None
         tail: Optional[str] = None
         for child in children or []:
-            span = walk(child)
+            span = yield from walk(child)
             if span is None:
                 continue
             if head is None:
@@ -67,15 +79,17 @@ def ir_to_mermaid(ir: Dict[str, Any]) -> str:
             else:
                 b.edge(tail, span[0])  # type: ignore[arg-type]
             tail = span[1]
+            yield from b.drain()
         return (head, tail) if head is not None else None
 
-    def walk(stmt: Dict[str, Any]) -> Optional[Span]:
+    def walk(stmt: Dict[str, Any]) -> Walk:
         kind = stmt.get("kind")
         summary = stmt.get("summary") or kind or "stmt"
 
         if kind == "FunctionDef":
             head = b.rect(summary)
-            body = walk_block(stmt.get("body", []))
+            yield from b.drain()
+            body = yield from walk_block(stmt.get("body", []))
             if body:
                 b.edge(head, body[0])
                 return (head, body[1])
@@ -84,13 +98,15 @@ def ir_to_mermaid(ir: Dict[str, Any]) -> str:
         if kind == "If":
             test = b.diamond(f"{_clean(stmt.get('test'))}?")
             exit_id = b.rect("continue")
-            then_span = walk_block(stmt.get("body", []))
+            yield from b.drain()
+            then_span = yield from walk_block(stmt.get("body", []))
             if then_span:
                 b.edge(test, then_span[0], "yes")
                 b.edge(then_span[1], exit_id)
             else:
                 b.edge(test, exit_id, "yes")
-            else_span = walk_block(stmt.get("orelse", []))
+            yield from b.drain()
+            else_span = yield from walk_block(stmt.get("orelse", []))
             if else_span:
                 b.edge(test, else_span[0], "no")
                 b.edge(else_span[1], exit_id)
@@ -102,7 +118,8 @@ def ir_to_mermaid(ir: Dict[str, Any]) -> str:
             label = (f"for {_clean(stmt.get('target'))} in {_clean(stmt.get('iter'))}?"
                      if kind == "For" else f"{_clean(stmt.get('test'))}?")
             dec = b.diamond(label)
-            body = walk_block(stmt.get("body", []))
+            yield from b.drain()
+            body = yield from walk_block(stmt.get("body", []))
             if body:
                 b.edge(dec, body[0], "loop")
                 b.edge(body[1], dec)  # back-edge to re-check the condition
@@ -134,11 +151,15 @@ def ir_to_mermaid(ir: Dict[str, Any]) -> str:
 
     tail: Optional[str] = None
     for top in ir.get("body", []):
-        span = walk(top)
+        span = yield from walk(top)
         if span is None:
             continue
         if tail:
             b.edge(tail, span[0])
         tail = span[1]
+        yield from b.drain()
+    yield from b.drain()
 
-    return "\n".join(b.lines)
+
+def ir_to_mermaid(ir: Dict[str, Any]) -> str:
+    return "\n".join(iter_mermaid(ir))
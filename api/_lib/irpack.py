@@ -0,0 +1,320 @@
+"""Compact binary encoding of the IR (stdlib only).
+
+The IR is a deep tree of small dicts whose keys ("kind", "summary", "line",
+"body", ...) and many values repeat thousands of times in a big file. JSON and
+pickle spell every one of them out. This format doesn't:
+
+    header      struct "<4sBIII": magic, version, #kinds, #strings, #nodes
+    kinds       the distinct node kinds, each as varint length + UTF-8
+    strings     every other distinct key/value string, same encoding
+    kind column one little-endian uint16 per node: index into `kinds`
+    line column one varint per node: 0 = no "line" key, 1 = None, else line + 2
+    structure   the tree, pre-order, as tagged values (see the _T* tags)
+
+Nodes (dicts with a string "kind") are numbered in pre-order, and their kind
+and line live in the two columns instead of the structure. So `IRView` can
+answer "how many loops, on which lines" straight from the buffer, without
+decoding the tree. `decode` accepts bytes, bytearray or a memoryview (for
+example over an mmap) and reads it in place without copying.
+
+Decoded IR compares equal to the original; only the position of "line" among a
+node's keys may move, which nothing in the pipeline depends on.
+
+The win is size, and a modest one: on all of this repo's Python API (about
+160 KB of source) it is 1.6x smaller than compact JSON and 1.2x smaller than
+pickle; on a single module, 1.25x and 1.05x. Gzipped, all three come out about
+the same. Being pure Python, it encodes 2-3x slower than the C-accelerated JSON
+codec and about 10x slower than pickle, and decodes 3-7x slower than either.
+So it's a storage format for IR that sits in memory or on disk, where the
+kind/line columns can be read in place: hot paths such as handing IR between
+processes should stick to pickle. See benchmarks/bench_irpack.py.
+
+A truncated or corrupted buffer raises ValueError, never IndexError or a
+struct error.
+"""
+
+from __future__ import annotations
+
+import struct
+import sys
+from array import array
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+MAGIC = b"CLIR"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sBIII")
+
+# Value tags in the structure stream.
+_TNONE, _TFALSE, _TTRUE, _TINT, _TSTR, _TLIST, _TDICT, _TNODE = range(8)
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def _put_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _put_string(out: bytearray, text: str) -> None:
+    raw = text.encode("utf-8")
+    _put_varint(out, len(raw))
+    out += raw
+
+
+def encode(ir: Dict[str, Any]) -> bytes:
+    """Serialize an IR tree. Raises TypeError for values the IR never holds
+    (floats, tuples, ...)."""
+    kinds: Dict[str, int] = {}
+    strings: Dict[str, int] = {}
+    kind_col = array("H")
+    line_col = bytearray()
+    body = bytearray()
+
+    def intern(table: Dict[str, int], text: str) -> int:
+        idx = table.get(text)
+        if idx is None:
+            idx = table[text] = len(table)
+        return idx
+
+    def put(value: Any) -> None:
+        if value is None:
+            body.append(_TNONE)
+        elif value is True:
+            body.append(_TTRUE)
+        elif value is False:
+            body.append(_TFALSE)
+        elif isinstance(value, int):
+            body.append(_TINT)
+            # Zig-zag so small negative numbers stay small.
+            _put_varint(body, value * 2 if value >= 0 else -value * 2 - 1)
+        elif isinstance(value, str):
+            body.append(_TSTR)
+            _put_varint(body, intern(strings, value))
+        elif isinstance(value, list):
+            body.append(_TLIST)
+            _put_varint(body, len(value))
+            for item in value:
+                put(item)
+        elif isinstance(value, dict):
+            if isinstance(value.get("kind"), str):
+                put_node(value)
+                return
+            body.append(_TDICT)
+            _put_varint(body, len(value))
+            for key, item in value.items():
+                _put_varint(body, intern(strings, key))
+                put(item)
+        else:
+            raise TypeError(f"irpack can't encode {type(value).__name__}")
+
+    def put_node(node: Dict[str, Any]) -> None:
+        body.append(_TNODE)
+        kind_col.append(intern(kinds, node["kind"]))
+        if "line" not in node:
+            line_col.append(0)
+        elif node["line"] is None:
+            line_col.append(1)
+        else:
+            _put_varint(line_col, node["line"] + 2)
+        fields = [(k, v) for k, v in node.items() if k != "kind" and k != "line"]
+        _put_varint(body, len(fields))
+        for key, item in fields:
+            _put_varint(body, intern(strings, key))
+            put(item)
+
+    put(ir)
+    if len(kinds) > 0xFFFF:
+        raise ValueError("too many distinct node kinds for irpack")
+
+    out = bytearray(_HEADER.pack(MAGIC, VERSION, len(kinds), len(strings), len(kind_col)))
+    for table in (kinds, strings):
+        for text in table:  # dicts keep insertion order == index order
+            _put_string(out, text)
+    if sys.byteorder != "little":
+        kind_col.byteswap()
+    out += kind_col.tobytes()
+    out += line_col
+    out += body
+    return bytes(out)
+
+
+class IRView:
+    """Read-only view over an encoded IR, parsed only as far as needed.
+
+    Construction reads the header and the two string tables. The kind column is
+    exposed without copying (`memoryview.cast`), and `lines()` decodes the line
+    column lazily; neither touches the tree itself.
+    """
+
+    def __init__(self, data: Buffer) -> None:
+        mv = data if isinstance(data, memoryview) else memoryview(data)
+        if mv.ndim != 1 or mv.itemsize != 1:
+            mv = mv.cast("B")
+        if len(mv) < _HEADER.size:
+            raise ValueError("not an irpack buffer")
+        magic, version, n_kinds, n_strings, n_nodes = _HEADER.unpack_from(mv, 0)
+        if magic != MAGIC:
+            raise ValueError("not an irpack buffer")
+        if version != VERSION:
+            raise ValueError(f"unsupported irpack version {version}")
+
+        self._mv = mv
+        pos = _HEADER.size
+        self.kind_names, pos = _read_strings(mv, pos, n_kinds)
+        self.strings, pos = _read_strings(mv, pos, n_strings)
+        self.node_count = n_nodes
+
+        end = pos + 2 * n_nodes
+        # Every node has a kind and at least one byte of line and structure.
+        if end + 2 * n_nodes > len(mv):
+            raise _truncated()
+        if sys.byteorder == "little":
+            self.kind_column: Any = mv[pos:end].cast("H")
+        else:
+            column = array("H", mv[pos:end])
+            column.byteswap()
+            self.kind_column = column
+        self._lines_at = end
+        self._body_at: int = -1
+
+    def kinds(self) -> Iterator[str]:
+        """Node kinds in pre-order."""
+        names = self.kind_names
+        for i in self.kind_column:
+            if i >= len(names):
+                raise _truncated()
+            yield names[i]
+
+    def lines(self) -> Iterator[Any]:
+        """Node line numbers in pre-order (None where a node has none)."""
+        mv, pos = self._mv, self._lines_at
+        for _ in range(self.node_count):
+            value, pos = _read_varint(mv, pos)
+            yield value - 2 if value > 1 else None
+        self._body_at = pos
+
+    def _skip_lines(self) -> int:
+        if self._body_at < 0:
+            mv, pos, end = self._mv, self._lines_at, len(self._mv)
+            for _ in range(self.node_count):
+                while pos < end and mv[pos] & 0x80:
+                    pos += 1
+                pos += 1
+            if pos > end:
+                raise _truncated()
+            self._body_at = pos
+        return self._body_at
+
+    def decode(self) -> Dict[str, Any]:
+        """Rebuild the full IR tree."""
+        mv = self._mv
+        strings = self.strings
+        kinds = self.kind_names
+        kind_column = self.kind_column
+        line_iter = self._raw_lines()
+        pos = self._skip_lines()
+        node_no = 0
+
+        def varint() -> int:
+            nonlocal pos
+            byte = mv[pos]
+            pos += 1
+            if byte < 0x80:
+                return byte
+            result, shift = byte & 0x7F, 7
+            while True:
+                byte = mv[pos]
+                pos += 1
+                result |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    return result
+                shift += 7
+
+        def value() -> Any:
+            nonlocal pos, node_no
+            tag = mv[pos]
+            pos += 1
+            if tag == _TSTR:
+                return strings[varint()]
+            if tag == _TNODE:
+                node: Dict[str, Any] = {"kind": kinds[kind_column[node_no]]}
+                node_no += 1
+                line = next(line_iter)
+                if line is not _ABSENT_LINE:
+                    node["line"] = line
+                for _ in range(varint()):
+                    key = strings[varint()]
+                    node[key] = value()
+                return node
+            if tag == _TLIST:
+                return [value() for _ in range(varint())]
+            if tag == _TNONE:
+                return None
+            if tag == _TINT:
+                raw = varint()
+                return (raw >> 1) ^ -(raw & 1)
+            if tag == _TTRUE:
+                return True
+            if tag == _TFALSE:
+                return False
+            if tag == _TDICT:
+                out: Dict[str, Any] = {}
+                for _ in range(varint()):
+                    key = strings[varint()]
+                    out[key] = value()
+                return out
+            raise ValueError(f"corrupt irpack buffer (tag {tag} at {pos - 1})")
+
+        try:
+            return value()
+        except (IndexError, StopIteration, RecursionError):
+            # Ran off the end of the buffer or a table, or nesting no real IR has.
+            raise _truncated() from None
+
+    def _raw_lines(self) -> Iterator[Any]:
+        """Like `lines()`, but distinguishes a missing "line" key."""
+        mv, pos = self._mv, self._lines_at
+        for _ in range(self.node_count):
+            value, pos = _read_varint(mv, pos)
+            yield _ABSENT_LINE if value == 0 else (None if value == 1 else value - 2)
+
+
+# Sentinel for "this node had no line key at all" (as opposed to line=None).
+_ABSENT_LINE = object()
+
+
+def _truncated() -> ValueError:
+    return ValueError("truncated or corrupt irpack buffer")
+
+
+def _read_varint(mv: memoryview, pos: int) -> Tuple[int, int]:
+    result, shift = 0, 0
+    end = len(mv)
+    while True:
+        if pos >= end:
+            raise _truncated()
+        byte = mv[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _read_strings(mv: memoryview, pos: int, count: int) -> Tuple[List[str], int]:
+    out: List[str] = []
+    for _ in range(count):
+        length, pos = _read_varint(mv, pos)
+        if pos + length > len(mv):
+            raise _truncated()
+        out.append(str(mv[pos:pos + length], "utf-8"))
+        pos += length
+    return out, pos
+
+
+def decode(data: Buffer) -> Dict[str, Any]:
+    """Deserialize an IR tree produced by `encode`."""
+    return IRView(data).decode()
@@ -11,6 +11,8 @@ from __future__ import annotations
 import ast
 from typing import Any, Dict, List
 
+from .scope import WHOLE, Scope
+
 
 def _unparse(node: ast.AST | None) -> str:
     """Render an AST node back to source text, with a tiny fallback for very
@@ -172,7 +174,22 @@ def _walk_block(stmts: List[ast.stmt]) -> List[Dict[str, Any]]:
     return items
 
 
-def parse_python_to_ir(code: str) -> Dict[str, Any]:
-    """Parse Python source into the CodeLensAI IR."""
+def _first_line(node: ast.stmt) -> int:
+    """First line of a statement, counting any decorators above it."""
+    return min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", ())])
+
+
+def parse_python_to_ir(code: str, scope: Scope = WHOLE) -> Dict[str, Any]:
+    """Parse Python source into the CodeLensAI IR.
+
+    With a `scope`, only the top-level statements it selects are translated;
+    the rest of the tree is never walked.
+    """
     tree = ast.parse(code)
-    return {"kind": "Module", "body": _walk_block(tree.body)}
+    if scope.whole:
+        return {"kind": "Module", "body": _walk_block(tree.body)}
+    chosen, span = scope.select(
+        (s, getattr(s, "name", None), _first_line(s), getattr(s, "end_lineno", None) or s.lineno)
+        for s in tree.body
+    )
+    return {"kind": "Module", "body": _walk_block(chosen), "scope": span}
@@ -9,29 +9,185 @@ exotic syntax, but it's plenty for the "explain the shape of this code" use case
 
 from __future__ import annotations
 
+import os
 import re
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, Dict, Iterator, List, Optional, Pattern, Tuple
+
+from .scope import JS_LINE_END, WHOLE, Scope
+
+
+# CPU seconds one parse may use before it is abandoned. The matchers are linear,
+# so this is a backstop against whatever we haven't thought of, not a limit
+# real files get near (a 1 MB file, the most a whole-file request may send,
+# takes a fraction of it).
+try:
+    _CPU_BUDGET_SEC = float(os.getenv("CODELENS_JS_PARSE_BUDGET_MS", "3000")) / 1000
+except ValueError:
+    _CPU_BUDGET_SEC = 3.0
+
+
+class ParseBudgetExceeded(ValueError):
+    """The parse ran past its CPU budget. A ValueError, so the handler answers
+    400 with this message instead of tying up the worker."""
+
+    def __init__(self) -> None:
+        super().__init__("This code took too long to analyze. Try a smaller range "
+                         "with start_line/end_line.")
 
 
 def _clean(s: Optional[str]) -> str:
     return (s or "").strip()
 
 
+def _iter_lines(code: str) -> Iterator[str]:
+    """Yield the lines of `code` one at a time.
+
+    The same lines as `str.splitlines()`, but without materialising a list of
+    every line up front: for a multi-megabyte upload that list alone would
+    roughly double the memory held for the input.
+    """
+    start = 0
+    for brk in JS_LINE_END.finditer(code):
+        yield code[start:brk.start()]
+        start = brk.end()
+    if start < len(code):
+        yield code[start:]
+
+
 def _append(stack: List[Dict[str, Any]], stmt: Dict[str, Any]) -> None:
     stack[-1]["body"].append(stmt)
 
 
-_FUNC = re.compile(r"^\s*(?:export\s+)?(?:async\s+)?function\s+([A-Za-z_$][\w$]*)\s*\(([^)]*)\)\s*\{\s*$")
-_ARROW = re.compile(r"^\s*(?:export\s+)?const\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?\(([^)]*)\)\s*=>\s*\{\s*$")
-_IF = re.compile(r"^\s*(?:\}\s*)?(?:else\s+)?if\s*\((.*)\)\s*\{\s*$")
-_ELSE = re.compile(r"^\s*(?:\}\s*)?else\s*\{\s*$")
-_FOR_OF_IN = re.compile(r"^\s*for\s*\(\s*(?:const|let|var)\s+([^\s;]+)\s+(of|in)\s+(.*)\)\s*\{\s*$")
-_FOR_C = re.compile(r"^\s*for\s*\((.*);(.*);(.*)\)\s*\{\s*$")
-_WHILE = re.compile(r"^\s*while\s*\((.*)\)\s*\{\s*$")
-_RET = re.compile(r"^\s*return(?:\s+(.*?))?;?\s*$")
-_AUG = re.compile(r"^\s*([A-Za-z_$][\w$.\[\]]*)\s*(\+=|-=|\*=|/=|%=|\^=|\|=|&=|<<=|>>=)\s*(.*);?\s*$")
-_ASSIGN = re.compile(r"^\s*(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(.*?);?\s*$|^\s*([A-Za-z_$][\w$.\[\]]*)\s*=\s*(.*?);?\s*$")
-_CALL = re.compile(r"^\s*([A-Za-z_$][\w$.]*)\s*\(.*\)\s*;?\s*$")
+def _pop(stack: List[Dict[str, Any]], ends: Dict[int, int], line: int) -> None:
+    """Close the innermost block; back at top level, record where the
+    enclosing top-level statement ended (keyed by its index in the module)."""
+    stack.pop()
+    if len(stack) == 1:
+        ends[len(stack[0]["body"]) - 1] = line
+
+
+# Every matcher below runs in time linear in the line, however it's crafted.
+# Regexes only ever match an anchored head in which each quantifier is followed
+# by something it can't consume (`\s*` then `(`, an identifier then `=`, ...),
+# so there is exactly one way to match and nothing to backtrack into. The
+# open-ended tails that used to be `(.*)\)\s*\{\s*$`, several `(.*);` groups or a
+# lazy `(.*?);?\s*$` are taken apart with string methods instead. Each matcher
+# returns the same groups as the regex it replaced (`match.groups()`), or None.
+#
+# All of them expect the line already right-stripped, as the parse loop does.
+
+_FUNC_HEAD = re.compile(r"\s*(?:export\s+)?(?:async\s+)?function\s+([A-Za-z_$][\w$]*)\s*\(")
+_ARROW_HEAD = re.compile(r"\s*(?:export\s+)?const\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?\(")
+_IF_HEAD = re.compile(r"\s*(?:\}\s*)?(?:else\s+)?if\s*\(")
+_ELSE = re.compile(r"\s*(?:\}\s*)?else\s*\{")  # used with fullmatch
+_FOR_HEAD = re.compile(r"\s*for\s*\(")
+_FOR_OF_IN_HEAD = re.compile(r"\s*(?:const|let|var)\s+([^\s;]+)\s+(of|in)\s+")
+_WHILE_HEAD = re.compile(r"\s*while\s*\(")
+_RET_HEAD = re.compile(r"\s*return")
+_AUG_HEAD = re.compile(r"\s*([A-Za-z_$][\w$.\[\]]*)\s*(\+=|-=|\*=|/=|%=|\^=|\|=|&=|<<=|>>=)\s*")
+_DECL_HEAD = re.compile(r"\s*(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*")
+_ASSIGN_HEAD = re.compile(r"\s*([A-Za-z_$][\w$.\[\]]*)\s*=\s*")
+_CALL_HEAD = re.compile(r"\s*([A-Za-z_$][\w$.]*)\s*\(")
+
+
+def _before_brace(rest: str, arrow: bool = False) -> Optional[str]:
+    """`rest` minus its closing `) {` (or `) => {`), or None if it doesn't end
+    that way. The `)` is the last one before the brace, as with a greedy group."""
+    if not rest.endswith("{"):
+        return None
+    rest = rest[:-1].rstrip()
+    if arrow:
+        if not rest.endswith("=>"):
+            return None
+        rest = rest[:-2].rstrip()
+    return rest[:-1] if rest.endswith(")") else None
+
+
+def _match_function(line: str) -> Optional[Tuple[str, str]]:
+    """`function name(args) {` or `const name = (args) => {`: (name, args)."""
+    for head, arrow in ((_FUNC_HEAD, False), (_ARROW_HEAD, True)):
+        m = head.match(line)
+        if m:
+            args = _before_brace(line[m.end():], arrow)
+            if args is not None and ")" not in args:
+                return m.group(1), args
+    return None
+
+
+def _match_condition(head: Pattern[str], line: str) -> Optional[Tuple[str]]:
+    """`if (test) {` / `while (test) {` (per `head`): (test,)."""
+    m = head.match(line)
+    if not m:
+        return None
+    test = _before_brace(line[m.end():])
+    return None if test is None else (test,)
+
+
+def _match_for_of_in(line: str) -> Optional[Tuple[str, str, str]]:
+    """`for (const x of xs) {`: (target, "of" | "in", iterable)."""
+    m = _FOR_HEAD.match(line)
+    if not m:
+        return None
+    decl = _FOR_OF_IN_HEAD.match(line, m.end())
+    if not decl:
+        return None
+    iterable = _before_brace(line[decl.end():])
+    return None if iterable is None else (decl.group(1), decl.group(2), iterable)
+
+
+def _match_for_c(line: str) -> Optional[Tuple[str, str, str]]:
+    """`for (init; cond; step) {`: the three clauses, split at the last two `;`
+    exactly as three greedy groups would be."""
+    m = _FOR_HEAD.match(line)
+    if not m:
+        return None
+    inner = _before_brace(line[m.end():])
+    if inner is None:
+        return None
+    parts = inner.rsplit(";", 2)
+    return (parts[0], parts[1], parts[2]) if len(parts) == 3 else None
+
+
+def _match_return(line: str) -> Optional[Tuple[Optional[str]]]:
+    """`return`, `return;` or `return value[;]`: (value or None,)."""
+    m = _RET_HEAD.match(line)
+    if not m:
+        return None
+    rest = line[m.end():]
+    if not rest or rest == ";":
+        return (None,)
+    if not rest[0].isspace():
+        return None  # `returned = ...` is something else
+    value = rest.lstrip()
+    return (value[:-1] if value.endswith(";") else value,)
+
+
+def _match_aug(line: str) -> Optional[Tuple[str, str, str]]:
+    """`target op= value`: (target, op, value), value verbatim to end of line."""
+    m = _AUG_HEAD.match(line)
+    return None if not m else (m.group(1), m.group(2), line[m.end():])
+
+
+def _match_assign(line: str) -> Optional[Tuple[str, str]]:
+    """`const name = value[;]` or `target = value[;]`: (name, value)."""
+    m = _DECL_HEAD.match(line) or _ASSIGN_HEAD.match(line)
+    if not m:
+        return None
+    value = line[m.end():]
+    return m.group(1), value[:-1] if value.endswith(";") else value
+
+
+def _match_call(line: str) -> Optional[Tuple[str, str]]:
+    """`name(...)[;]`: (name, argument text)."""
+    m = _CALL_HEAD.match(line)
+    if not m:
+        return None
+    rest = line[m.end():]
+    if rest.endswith(";"):
+        rest = rest[:-1].rstrip()
+    return (m.group(1), rest[:-1]) if rest.endswith(")") else None
+
 
 _AUG_OPS = {
     "+=": "Add", "-=": "Sub", "*=": "Mult", "/=": "Div", "%=": "Mod",
@@ -39,33 +195,50 @@ _AUG_OPS = {
 }
 
 
-def parse_jsts_to_ir(code: str) -> Dict[str, Any]:
-    """Parse JS/TS source into the CodeLensAI IR (best effort)."""
+def parse_jsts_to_ir(code: str, scope: Scope = WHOLE,
+                     budget_sec: Optional[float] = None) -> Dict[str, Any]:
+    """Parse JS/TS source into the CodeLensAI IR (best effort).
+
+    With a `scope`, parsing stops at the first top-level line past its end and
+    only the top-level statements it selects are kept. Raises
+    `ParseBudgetExceeded` after `budget_sec` of CPU time (by default
+    CODELENS_JS_PARSE_BUDGET_MS; zero or less means no limit).
+    """
     root: Dict[str, Any] = {"kind": "Module", "body": []}
     stack: List[Dict[str, Any]] = [{"kind": "Block", "body": root["body"]}]
     # Tracks the most recent `if` so a following `else` can be attached to it.
     last_if: Optional[Dict[str, Any]] = None
+    # Last line of each top-level block statement, by index in root["body"].
+    ends: Dict[int, int] = {}
+    idx = 0
+    budget = _CPU_BUDGET_SEC if budget_sec is None else budget_sec
+    # Per-thread CPU time, so other requests on a threaded server don't count.
+    cpu_deadline = time.thread_time() + budget if budget > 0 else float("inf")
 
-    for idx, raw in enumerate(code.splitlines(), start=1):
+    for idx, raw in enumerate(_iter_lines(code), start=1):
+        if not idx & 0xFF and time.thread_time() > cpu_deadline:
+            raise ParseBudgetExceeded()
         line = raw.rstrip()
         if not line.strip():
             continue
+        if len(stack) == 1 and scope.past(idx):
+            break
 
         # A line that only closes a block pops the stack.
         if line.strip() == "}":
             if len(stack) > 1:
-                stack.pop()
+                _pop(stack, ends, idx)
             last_if = None
             continue
 
-        m = _FUNC.match(line) or _ARROW.match(line)
+        m = _match_function(line)
         if m:
-            args = [a.strip() for a in _clean(m.group(2)).split(",") if a.strip()]
+            args = [a.strip() for a in _clean(m[1]).split(",") if a.strip()]
             fn = {
                 "kind": "FunctionDef",
-                "summary": f"function {_clean(m.group(1))}({', '.join(args)})",
+                "summary": f"function {_clean(m[0])}({', '.join(args)})",
                 "line": idx,
-                "name": _clean(m.group(1)),
+                "name": _clean(m[0]),
                 "args": args,
                 "body": [],
             }
@@ -74,88 +247,97 @@ def parse_jsts_to_ir(code: str) -> Dict[str, Any]:
             last_if = None
             continue
 
-        m = _IF.match(line)
+        m = _match_condition(_IF_HEAD, line)
         if m:
             # A leading `}` means this is an `} else if {` continuation.
             if line.strip().startswith("}") and len(stack) > 1:
-                stack.pop()
+                _pop(stack, ends, idx)
             node = {"kind": "If", "summary": "if-statement", "line": idx,
-                    "test": _clean(m.group(1)), "body": [], "orelse": []}
+                    "test": _clean(m[0]), "body": [], "orelse": []}
             _append(stack, node)
             stack.append({"kind": "Block", "body": node["body"]})
             last_if = node
             continue
 
-        if _ELSE.match(line):
+        if _ELSE.fullmatch(line):
             if line.strip().startswith("}") and len(stack) > 1:
-                stack.pop()
+                _pop(stack, ends, idx)
             if last_if is not None:
                 else_body: List[Dict[str, Any]] = []
                 last_if["orelse"] = else_body
                 stack.append({"kind": "Block", "body": else_body})
             continue
 
-        m = _FOR_OF_IN.match(line)
+        m = _match_for_of_in(line)
         if m:
             node = {"kind": "For", "summary": "for-loop", "line": idx,
-                    "target": _clean(m.group(1)), "iter": _clean(m.group(3)),
+                    "target": _clean(m[0]), "iter": _clean(m[2]),
                     "body": [], "orelse": []}
             _append(stack, node)
             stack.append({"kind": "Block", "body": node["body"]})
             last_if = None
             continue
 
-        m = _FOR_C.match(line)
+        m = _match_for_c(line)
         if m:
-            cond = _clean(m.group(2))
+            cond = _clean(m[1])
             node = {"kind": "For", "summary": "for-loop", "line": idx,
-                    "target": "", "iter": cond or "(condition)", "body": [], "orelse": []}
+                    "target": "", "iter": cond or "(condition)", "step": _clean(m[2]),
+                    "body": [], "orelse": []}
             _append(stack, node)
             stack.append({"kind": "Block", "body": node["body"]})
             last_if = None
             continue
 
-        m = _WHILE.match(line)
+        m = _match_condition(_WHILE_HEAD, line)
         if m:
             node = {"kind": "While", "summary": "while-loop", "line": idx,
-                    "test": _clean(m.group(1)), "body": [], "orelse": []}
+                    "test": _clean(m[0]), "body": [], "orelse": []}
             _append(stack, node)
             stack.append({"kind": "Block", "body": node["body"]})
             last_if = None
             continue
 
-        m = _RET.match(line)
+        m = _match_return(line)
         if m:
             _append(stack, {"kind": "Return", "summary": "return", "line": idx,
-                            "value": _clean(m.group(1)) if m.group(1) else None})
+                            "value": _clean(m[0]) if m[0] else None})
             last_if = None
             continue
 
-        m = _AUG.match(line)
+        m = _match_aug(line)
         if m:
             _append(stack, {"kind": "AugAssign", "summary": "aug-assign", "line": idx,
-                            "target": _clean(m.group(1)),
-                            "op": _AUG_OPS.get(m.group(2), m.group(2)),
-                            "value": _clean(m.group(3))})
+                            "target": _clean(m[0]),
+                            "op": _AUG_OPS.get(m[1], m[1]),
+                            "value": _clean(m[2])})
             last_if = None
             continue
 
-        m = _ASSIGN.match(line)
+        m = _match_assign(line)
         if m:
-            name = m.group(1) or m.group(3)
-            value = m.group(2) or m.group(4)
+            name, value = m
             _append(stack, {"kind": "Assign", "summary": f"assign {name}", "line": idx,
                             "targets": [_clean(name)], "value": _clean(value)})
             last_if = None
             continue
 
-        m = _CALL.match(line)
+        m = _match_call(line)
         if m:
-            _append(stack, {"kind": "Call", "summary": f"call {_clean(m.group(1))}",
-                            "line": idx, "func": _clean(m.group(1))})
+            args = _clean(m[1])
+            _append(stack, {"kind": "Call", "summary": f"call {_clean(m[0])}",
+                            "line": idx, "func": _clean(m[0]), "args": [args] if args else []})
             last_if = None
             continue
 
         # Anything else (comments, declarations we don't model) is ignored.
 
+    if scope.whole:
+        return root
+    body = root["body"]
+    if len(stack) > 1 and body:
+        ends[len(body) - 1] = idx  # still open at the end of the input
+    root["body"], root["scope"] = scope.select(
+        (node, node.get("name"), node["line"], ends.get(i, node["line"])) for i, node in enumerate(body)
+    )
     return root
@@ -0,0 +1,158 @@
+"""Opt-in per-request profiling for the explain endpoint.
+
+When one specific input is slow in production we want a profile of exactly that
+request, not a synthetic reproduction. Profiling is off unless
+CODELENS_PROFILE names the collectors to run ("cpu", "mem" or "cpu,mem"); a
+request is then captured either by random sampling (CODELENS_PROFILE_RATE, a
+fraction between 0 and 1) or by sending the admin header below with the value of
+CODELENS_PROFILE_TOKEN.
+
+Captures land in CODELENS_PROFILE_DIR (default: a folder under /tmp, the only
+writable path on Vercel) as `<time>-<input hash>.pstats` for cProfile and
+`.tracemalloc` for tracemalloc snapshots. The directory is trimmed oldest-first
+to CODELENS_PROFILE_MAX_BYTES so a busy instance can't fill its disk. Load them
+offline with `pstats.Stats(path)` / `tracemalloc.Snapshot.load(path)`.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+# Request header that forces a capture when it matches CODELENS_PROFILE_TOKEN.
+HEADER = "X-CodeLens-Profile"
+
+_DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+_SUFFIXES = (".pstats", ".tracemalloc")
+
+# One capture at a time per process. cProfile and tracemalloc are both
+# process-wide: a second profiler can't start while one runs (Python 3.12+), and
+# one request stopping tracemalloc would pull it out from under another.
+_CAPTURE = threading.Lock()
+
+
+def _modes() -> Tuple[bool, bool]:
+    """Which collectors are enabled: (cpu, mem)."""
+    raw = os.getenv("CODELENS_PROFILE", "")
+    modes = {m.strip().lower() for m in raw.split(",") if m.strip()}
+    return "cpu" in modes, "mem" in modes
+
+
+def _wanted(token: Optional[str]) -> bool:
+    """Decide whether this request is captured: admin header first, then the
+    sampling rate."""
+    import hmac
+    import random
+
+    secret = os.getenv("CODELENS_PROFILE_TOKEN")
+    # Compared as bytes: compare_digest refuses non-ASCII str, and header values
+    # arrive latin-1 decoded, so any byte a client sends is possible here.
+    if secret and token and hmac.compare_digest(secret.encode("utf-8"),
+                                                token.encode("utf-8", "surrogateescape")):
+        return True
+    try:
+        rate = float(os.getenv("CODELENS_PROFILE_RATE", "0"))
+    except ValueError:
+        rate = 0.0
+    return rate > 0 and random.random() < rate
+
+
+def _rotate(directory: str, max_bytes: int) -> None:
+    """Delete the oldest captures until the directory fits in `max_bytes`."""
+    files: List[Tuple[float, int, str]] = []
+    for name in os.listdir(directory):
+        if not name.endswith(_SUFFIXES):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        files.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def call(fn: Callable[..., Any], *args: Any, key: str, token: Optional[str] = None) -> Any:
+    """Run `fn(*args)`, profiling it when enabled and selected.
+
+    `key` (the input hash) goes into the capture filenames so a slow request can
+    be matched back to its input. A request selected while another capture is
+    running is simply not profiled, and collector or dump failures are
+    swallowed: profiling must never change what the caller sees.
+    """
+    cpu, mem = _modes()
+    if not (cpu or mem) or not _wanted(token):
+        return fn(*args)
+    if not _CAPTURE.acquire(blocking=False):
+        return fn(*args)
+
+    # Imported here so the common, unprofiled path never pays for them.
+    import cProfile
+    import tracemalloc
+
+    profiler = None
+    started_tracing = False
+    try:
+        if cpu:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another tool already owns the profiling hook.
+                profiler = None
+        if mem and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+    except Exception:
+        if profiler is not None:
+            profiler.disable()
+        _CAPTURE.release()
+        return fn(*args)
+
+    try:
+        return fn(*args)
+    finally:
+        # Capture even when `fn` raises: pathological inputs often do.
+        try:
+            if profiler is not None:
+                profiler.disable()
+            snapshot = tracemalloc.take_snapshot() if mem and tracemalloc.is_tracing() else None
+            if started_tracing:
+                tracemalloc.stop()
+            _dump(key, profiler, snapshot)
+        except Exception:
+            pass
+        finally:
+            _CAPTURE.release()
+
+
+def _dump(key: str, profiler: Any, snapshot: Any) -> None:
+    import tempfile
+
+    directory = os.getenv("CODELENS_PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "codelens-profiles")
+    try:
+        max_bytes = int(os.getenv("CODELENS_PROFILE_MAX_BYTES", _DEFAULT_MAX_BYTES))
+    except ValueError:
+        max_bytes = _DEFAULT_MAX_BYTES
+
+    stem = os.path.join(directory, f"{int(time.time() * 1000)}-{key}")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        if profiler is not None:
+            profiler.dump_stats(stem + ".pstats")
+        if snapshot is not None:
+            snapshot.dump(stem + ".tracemalloc")
+        _rotate(directory, max_bytes)
+    except OSError:
+        pass
@@ -0,0 +1,410 @@
+"""Project mode: many files, one symbol index.
+
+A normal request explains one isolated snippet, so anything that reaches across
+files (what does this call, and what does that cost?) would mean re-parsing
+the whole project for every question. `build` parses a set of files once, in
+parallel, into a `ProjectIndex` holding:
+
+- every top-level function under a qualified name (`pkg.mod.func` for Python,
+  `src/util.add` for JS/TS), with its file, line and IR, kept packed with
+  `irpack` and decoded only when that function is asked about;
+- the calls between them, resolved through each file's imports, so an edge
+  can cross modules.
+
+`ProjectIndex.explain` then answers for one function (steps, diagram, Big-O)
+straight from the index, pricing calls into other modules with their own IR,
+and remembers the answer.
+
+Worker processes hand back plain IR, which crosses the process boundary as a
+pickle (C-fast both ways); the index packs it with `irpack` as it is stored,
+since that's where its smaller size pays. Where processes aren't available
+(some sandboxes and serverless runtimes) parsing falls back to running inline.
+"""
+
+from __future__ import annotations
+
+import os
+import posixpath
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from . import irpack
+
+LANGUAGES = {
+    ".py": "python",
+    ".js": "javascript", ".jsx": "javascript", ".mjs": "javascript", ".cjs": "javascript",
+    ".ts": "typescript", ".tsx": "typescript",
+}
+
+# Directories that never hold the project's own code.
+SKIP_DIRS = frozenset({".git", ".hg", "node_modules", "__pycache__", ".venv", "venv",
+                       "dist", "build", "__MACOSX"})
+
+# How many functions (transitively called) may join one Big-O estimate.
+_MAX_CALLEES = 200
+
+# A single file over this many characters is listed with an error instead of
+# parsed: the parsers' memory grows with the file, and /api/explain caps a
+# whole Python file at the same size.
+_MAX_FILE_CHARS = 512 * 1024
+
+# Below this many files, starting worker processes costs more than it saves.
+_MIN_PARALLEL_FILES = 16
+
+# A call site: a possibly dotted name followed by "(". The lookbehind stops a
+# match from starting mid-identifier, which keeps the scan linear.
+_CALL = re.compile(r"(?<![\w$.])([A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*)\s*\(")
+# `import ... from "x"` and `const ... = require("x")`, heads only (see parser_js).
+_JS_IMPORT = re.compile(r"\s*import\s+(?:type\s+)?([^'\"]*)['\"]([^'\"]+)['\"]")
+_JS_REQUIRE = re.compile(r"\s*(?:const|let|var)\s+([^=]*)=\s*require\s*\(\s*['\"]([^'\"]+)['\"]")
+_IDENT = re.compile(r"[A-Za-z_$][\w$]*")
+
+# An import binds a local name to (module, member or None).
+Imports = Dict[str, Tuple[str, Optional[str]]]
+
+
+class UnknownSymbol(LookupError):
+    """No function (or no single function) goes by the requested name."""
+
+
+class Symbol(NamedTuple):
+    qualname: str
+    name: str
+    module: str
+    path: str
+    line: Optional[int]
+    language: str
+
+
+def language_for(path: str) -> Optional[str]:
+    return LANGUAGES.get(posixpath.splitext(path)[1].lower())
+
+
+def module_name(path: str, language: str) -> str:
+    """`pkg/mod.py` -> `pkg.mod` (`pkg/__init__.py` -> `pkg`); JS/TS modules
+    are their path without the extension, as relative imports spell them."""
+    stem = posixpath.splitext(path)[0]
+    if language != "python":
+        return stem
+    parts = stem.split("/")
+    if len(parts) > 1 and parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+
+# -- per-file work (runs in worker processes) ----------------------------------
+
+def _python_imports(ir: Dict[str, Any], path: str, module: str) -> Imports:
+    package = module if path.endswith("__init__.py") else module.rpartition(".")[0]
+    out: Imports = {}
+    for node in ir.get("body", []):
+        if node.get("kind") == "Import":
+            for alias in node.get("names", []):
+                # `import a.b` binds "a.b" as far as dotted calls are concerned.
+                out[alias["asname"] or alias["name"]] = (alias["name"], None)
+        elif node.get("kind") == "ImportFrom":
+            base = node.get("module") or ""
+            level = node.get("level") or 0
+            if level:
+                parts = package.split(".") if package else []
+                parts = parts[:len(parts) - (level - 1)] if level > 1 else parts
+                base = ".".join(parts + ([base] if base else []))
+            for alias in node.get("names", []):
+                if alias["name"] != "*":
+                    out[alias["asname"] or alias["name"]] = (base, alias["name"])
+    return out
+
+
+def _js_target(path: str, spec: str) -> Optional[str]:
+    """The module a relative import points at; packages aren't indexed."""
+    if not spec.startswith("."):
+        return None
+    target = posixpath.normpath(posixpath.join(posixpath.dirname(path), spec))
+    stem, ext = posixpath.splitext(target)
+    return stem if ext.lower() in LANGUAGES else target
+
+
+def _js_bindings(clause: str, target: str, out: Imports, is_import: bool) -> None:
+    """Names bound by an import clause or a require() left-hand side."""
+    clause = clause.strip()
+    if clause.startswith("* as "):
+        out[clause[5:].strip()] = (target, None)
+        return
+    open_at = clause.find("{")
+    if open_at == -1:
+        # `import add from`: the default export, which we take to be the
+        # function of the same name. `const util = require()`: the module.
+        default = _IDENT.fullmatch(clause.rstrip(", "))
+        if default:
+            out[default.group(0)] = (target, default.group(0) if is_import else None)
+        return
+    head = clause[:open_at].rstrip(", ").strip()
+    if _IDENT.fullmatch(head):
+        out[head] = (target, head)
+    for item in clause[open_at + 1:clause.find("}", open_at)].split(","):
+        # `a as b` (import) and `a: b` (destructuring) both bind b to a.
+        name, _, local = item.replace(":", " as ").partition(" as ")
+        name, local = name.strip(), (local.strip() or name.strip())
+        if _IDENT.fullmatch(name) and _IDENT.fullmatch(local):
+            out[local] = (target, name)
+
+
+def _js_imports(code: str, path: str) -> Imports:
+    out: Imports = {}
+    for line in code.splitlines():
+        m = _JS_IMPORT.match(line)
+        if m:
+            clause = m.group(1).rstrip()
+            if not clause.endswith("from"):
+                continue  # `import "./side-effect"`
+            clause = clause[:-4]
+        else:
+            m = _JS_REQUIRE.match(line)
+            if not m:
+                continue
+            clause = m.group(1)
+        target = _js_target(path, m.group(2))
+        if target is not None:
+            _js_bindings(clause, target, out, is_import=m.re is _JS_IMPORT)
+    return out
+
+
+def _call_sites(node: Dict[str, Any], out: Set[str]) -> Set[str]:
+    """Every name called anywhere inside an IR subtree."""
+    if node.get("kind") == "Call" and isinstance(node.get("func"), str):
+        out.add(node["func"])
+    for key, value in node.items():
+        if key in ("kind", "summary", "name"):
+            continue
+        if isinstance(value, str):
+            out.update(m.group(1) for m in _CALL.finditer(value))
+        elif isinstance(value, dict):
+            _call_sites(value, out)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    _call_sites(item, out)
+                elif isinstance(item, str):
+                    out.update(m.group(1) for m in _CALL.finditer(item))
+    return out
+
+
+def _parse_file(job: Tuple[str, str, str]) -> Dict[str, Any]:
+    """Parse one file into what the index needs. Never raises for bad input:
+    a file that doesn't parse, nests too deeply or is too big is reported with
+    its error instead, so one bad file can't sink the whole project."""
+    path, language, code = job
+    module = module_name(path, language)
+    result: Dict[str, Any] = {"path": path, "language": language, "module": module,
+                              "functions": [], "imports": {}, "error": None}
+    if len(code) > _MAX_FILE_CHARS:
+        result["error"] = f"file too large to analyze (over {_MAX_FILE_CHARS // 1024} KB)"
+        return result
+    try:
+        if language == "python":
+            from . import parser
+
+            ir = parser.parse_python_to_ir(code)
+            result["imports"] = _python_imports(ir, path, module)
+        else:
+            from . import parser_js
+
+            ir = parser_js.parse_jsts_to_ir(code)
+            result["imports"] = _js_imports(code, path)
+    except SyntaxError as exc:
+        result["error"] = f"line {exc.lineno}: {exc.msg}"
+        return result
+    except ValueError as exc:
+        result["error"] = str(exc)
+        return result
+    except RecursionError:
+        # ast and the IR walk recurse per nesting level: `1+1+...` with
+        # thousands of terms is enough.
+        result["error"] = "too deeply nested to analyze"
+        return result
+    except MemoryError:
+        result["error"] = "too large to analyze"
+        return result
+
+    for node in ir.get("body", []):
+        if node.get("kind") == "FunctionDef" and node.get("name"):
+            calls = sorted(_call_sites(node, set()))
+            result["functions"].append((node["name"], node.get("line"), node, calls))
+    return result
+
+
+def _parse_all(jobs: List[Tuple[str, str, str]], workers: Optional[int]) -> List[Dict[str, Any]]:
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    if workers > 1 and len(jobs) >= _MIN_PARALLEL_FILES:
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+            from concurrent.futures.process import BrokenProcessPool
+
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+                chunk = max(1, len(jobs) // (workers * 4))
+                return list(pool.map(_parse_file, jobs, chunksize=chunk))
+        except (OSError, NotImplementedError, ImportError, BrokenProcessPool):
+            pass  # no usable process support here: parse inline instead
+    return [_parse_file(job) for job in jobs]
+
+
+# -- the index -----------------------------------------------------------------
+
+class ProjectIndex:
+    """Functions, their packed IR and the call edges between them."""
+
+    def __init__(self, results: List[Dict[str, Any]]) -> None:
+        self.files: List[Dict[str, Any]] = []
+        self.symbols: Dict[str, Symbol] = {}
+        # qualname -> [(callee qualname, the name it was called by)]
+        self.calls: Dict[str, List[Tuple[str, str]]] = {}
+        self._packed: Dict[str, bytes] = {}
+        self._by_name: Dict[str, List[str]] = {}
+        self._explained: Dict[str, Dict[str, Any]] = {}
+
+        for r in sorted(results, key=lambda r: r["path"]):
+            self.files.append({"path": r["path"], "module": r["module"], "language": r["language"],
+                               "functions": len(r["functions"]), "error": r["error"]})
+            for name, line, node, _ in r["functions"]:
+                qual = f"{r['module']}.{name}"
+                self.symbols[qual] = Symbol(qual, name, r["module"], r["path"], line, r["language"])
+                self._packed[qual] = irpack.encode(node)
+                self._by_name.setdefault(name, []).append(qual)
+
+        modules = {f["module"] for f in self.files}
+        for r in results:
+            for name, _, _, sites in r["functions"]:
+                caller = f"{r['module']}.{name}"
+                edges = []
+                for site in sites:
+                    callee = self._resolve(site, r["module"], r["imports"], modules)
+                    if callee is not None and callee != caller:
+                        edges.append((callee, site))
+                self.calls[caller] = edges
+
+    def _resolve(self, site: str, module: str, imports: Imports, modules: Set[str]) -> Optional[str]:
+        """The qualname a call site refers to, if it's a function in the index."""
+        local = f"{module}.{site}"
+        if local in self.symbols:
+            return local
+        parts = site.split(".")
+        for i in range(len(parts), 0, -1):
+            bound = imports.get(".".join(parts[:i]))
+            if bound is None:
+                continue
+            target, member = bound
+            if target not in modules and f"{target}/index" in modules:
+                target = f"{target}/index"  # `./lib` meaning `./lib/index.js`
+            qual = ".".join([target] + ([member] if member else []) + parts[i:])
+            return qual if qual in self.symbols else None
+        return None
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def lookup(self, name: str) -> Symbol:
+        """A function by qualified name, or by bare name when that's unique.
+        Raises UnknownSymbol otherwise."""
+        if name in self.symbols:
+            return self.symbols[name]
+        matches = self._by_name.get(name, [])
+        if len(matches) == 1:
+            return self.symbols[matches[0]]
+        if matches:
+            raise UnknownSymbol(f"{name!r} is ambiguous: {', '.join(sorted(matches))}")
+        raise UnknownSymbol(f"No function named {name!r} in this project.")
+
+    def ir(self, qualname: str) -> Dict[str, Any]:
+        """The FunctionDef IR node for a function (decoded on every call)."""
+        return irpack.decode(self._packed[qualname])
+
+    def called_by(self, qualname: str) -> List[str]:
+        return sorted(caller for caller, edges in self.calls.items()
+                      if any(callee == qualname for callee, _ in edges))
+
+    def edges(self) -> List[Tuple[str, str]]:
+        """Every resolved (caller, callee) pair, sorted."""
+        return sorted({(caller, callee) for caller, edges in self.calls.items() for callee, _ in edges})
+
+    def _with_callees(self, qualname: str) -> List[Dict[str, Any]]:
+        """The function plus everything it transitively calls, each callee
+        renamed to the name its caller used so the analyzer can match it."""
+        root = self.ir(qualname)
+        nodes = [root]
+        seen = {qualname}
+        taken = {root["name"]}
+        queue = [qualname]
+        while queue and len(nodes) <= _MAX_CALLEES:
+            for callee, site in self.calls.get(queue.pop(0), []):
+                # One copy per name it's called by (`helper` and `b.helper`).
+                if site not in taken:
+                    taken.add(site)
+                    nodes.append({**self.ir(callee), "name": site})
+                if callee not in seen:
+                    seen.add(callee)
+                    queue.append(callee)
+        return nodes
+
+    def describe(self, qualname: str) -> Dict[str, Any]:
+        s = self.symbols[qualname]
+        return {"name": s.qualname, "path": s.path, "line": s.line, "language": s.language}
+
+    def summary(self) -> Dict[str, Any]:
+        """JSON-ready overview: files, functions and call edges."""
+        return {
+            "files": self.files,
+            "symbols": [self.describe(q) for q in sorted(self.symbols)],
+            "calls": [{"from": a, "to": b, "cross_module": self.symbols[a].module != self.symbols[b].module}
+                      for a, b in self.edges()],
+        }
+
+    def explain(self, name: str) -> Dict[str, Any]:
+        """Steps, diagram and Big-O for one function, from the index alone."""
+        qual = self.lookup(name).qualname
+        known = self._explained.get(qual)
+        if known is not None:
+            return known
+
+        from . import complexity, explainer, graph
+
+        module = {"kind": "Module", "body": [self.ir(qual)]}
+        try:
+            diagram = graph.ir_to_mermaid(module)
+        except Exception:
+            diagram = ""
+        analysis = complexity.analyze({"kind": "Module", "body": self._with_callees(qual)})
+        result = {
+            "symbol": self.describe(qual),
+            "steps": explainer.explain_ir(module),
+            "diagram": diagram,
+            "complexity": analysis["complexity"],
+            "confidence": analysis["confidence"],
+            "calls": sorted({callee for callee, _ in self.calls.get(qual, [])}),
+            "called_by": self.called_by(qual),
+        }
+        self._explained[qual] = result
+        return result
+
+
+def build(files: Iterable[Tuple[str, str]], workers: Optional[int] = None) -> ProjectIndex:
+    """Index (path, source) pairs. Paths are relative and "/"-separated; files
+    in languages we don't parse are skipped. `workers` defaults to the CPU
+    count; 1 parses inline."""
+    jobs = []
+    for path, code in files:
+        language = language_for(path)
+        if language is not None:
+            jobs.append((path, language, code))
+    return ProjectIndex(_parse_all(jobs, workers))
+
+
+def iter_directory(root: str) -> Iterable[Tuple[str, str]]:
+    """(relative posix path, source) for every parseable file under `root`."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith("."))
+        for filename in sorted(filenames):
+            if language_for(filename) is None:
+                continue
+            full = os.path.join(dirpath, filename)
+            with open(full, encoding="utf-8", errors="replace") as fh:
+                yield os.path.relpath(full, root).replace(os.sep, "/"), fh.read()
@@ -0,0 +1,125 @@
+"""Restricting analysis to part of a file.
+
+The editor shows about 60 lines at a time, and explaining and graphing a
+several-thousand-line file for that is wasted work. A `Scope` names the part a
+request cares about: a line range, one top-level function by name, or both.
+The parsers then build IR only for the top-level statements it touches, and
+everything downstream (steps, diagram, complexity) just sees a smaller IR.
+
+Selection works on whole top-level statements, so a range that starts halfway
+through a function pulls in the entire function. The scoped Module records the
+lines actually covered as `"scope": {"start_line": ..., "end_line": ...}`.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, Iterable, List, NamedTuple, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# What ends a line for each parser's numbering. `ast` counts only \r\n, \r and
+# \n; the JS parser breaks wherever `str.splitlines()` would.
+_PYTHON_LINE_END = re.compile(r"\r\n?|\n")
+JS_LINE_END = re.compile(r"\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]")
+
+
+class Scope(NamedTuple):
+    start_line: Optional[int] = None
+    end_line: Optional[int] = None
+    function: Optional[str] = None
+
+    @property
+    def whole(self) -> bool:
+        return self.start_line is None and self.end_line is None and self.function is None
+
+    def key(self) -> str:
+        """Stable text form for cache keys ("" for the whole file)."""
+        if self.whole:
+            return ""
+        return f"{self.start_line or ''}-{self.end_line or ''}:{self.function or ''}"
+
+    def past(self, line: int) -> bool:
+        """True once `line` is beyond the end of the range."""
+        return self.end_line is not None and line > self.end_line
+
+    def wants(self, name: Optional[str], first: int, last: int) -> bool:
+        """Does a top-level statement spanning `first`..`last` fall in scope?"""
+        if self.function is not None and name != self.function:
+            return False
+        if self.start_line is not None and last < self.start_line:
+            return False
+        return not self.past(first)
+
+    def select(self, candidates: Iterable[Tuple[T, Optional[str], int, int]]) -> Tuple[List[T], dict]:
+        """Filter (item, name, first line, last line) tuples.
+
+        Returns the kept items and the span they cover. Raises ValueError when a
+        named function isn't there; an empty line range is not an error.
+        """
+        kept: List[T] = []
+        first_line: Optional[int] = None
+        last_line: Optional[int] = None
+        for item, name, first, last in candidates:
+            if self.wants(name, first, last):
+                kept.append(item)
+                first_line = first if first_line is None else first_line
+                last_line = last
+        if not kept and self.function is not None:
+            raise ValueError(f"No top-level function named {self.function!r}.")
+        span = {"start_line": first_line if first_line is not None else self.start_line,
+                "end_line": last_line if last_line is not None else self.end_line}
+        return kept, span
+
+
+WHOLE = Scope()
+
+
+def _line_number(name: str, value: Any) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"{name} must be a positive line number.")
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a positive line number.") from None
+    if number < 1:
+        raise ValueError(f"{name} must be a positive line number.")
+    return number
+
+
+def from_params(start_line: Any = None, end_line: Any = None, function: Any = None) -> Scope:
+    """Build a Scope from raw request values (ints or numeric strings).
+    Raises ValueError with a client-safe message for anything malformed."""
+    start = _line_number("start_line", start_line)
+    end = _line_number("end_line", end_line)
+    if start is not None and end is not None and end < start:
+        raise ValueError("end_line must not be before start_line.")
+    if function is not None and function != "":
+        if not isinstance(function, str) or not function.strip():
+            raise ValueError("function must be a name.")
+        function = function.strip()
+    else:
+        function = None
+    return Scope(start, end, function)
+
+
+def source_lines(code: str, first: Optional[int], last: Optional[int], language: str = "python") -> str:
+    """Lines `first`..`last` (1-based, inclusive) of `code`, counted the way
+    `language`'s parser counts them. The line ends are walked lazily so a big
+    file isn't split into a list first."""
+    if first is None and last is None:
+        return code
+    first = first or 1
+    begin = 0 if first == 1 else None
+    line = 1
+    line_end = _PYTHON_LINE_END if language == "python" else JS_LINE_END
+    for brk in line_end.finditer(code):
+        # `brk` ends line number `line`.
+        if line == last and begin is not None:
+            return code[begin:brk.start()]
+        line += 1
+        if line == first:
+            begin = brk.end()
+    return "" if begin is None else code[begin:]
@@ -0,0 +1,131 @@
+"""Precomputed explanations for well-known snippets.
+
+A large share of traffic is the same canonical code: the editor's own samples,
+textbook algorithms, interview problems. `scripts/build_snippet_index.py` runs
+the full pipeline (model insights included) over the curated `corpus/` offline
+and writes the results to a read-only index file. The handler memory-maps that
+file at startup and answers a matching request with a lookup: no parsing, no
+model call.
+
+File layout (all little-endian):
+
+    header   struct "<4sBI": magic, version, entry count
+    entries  `count` x struct "<16sII": fingerprint, payload offset, length,
+             sorted by fingerprint
+    payloads UTF-8 JSON response bodies
+
+Opening reads only the 9-byte header; a lookup binary-searches the entry table
+inside the mmap and decodes just the one matching payload.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+MAGIC = b"CLIX"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sBI")
+_ENTRY = struct.Struct("<16sII")
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "_data", "snippets.idx")
+
+
+def normalize(code: str) -> str:
+    """Canonical form for matching: unified newlines, no trailing whitespace.
+
+    Nothing that moves a line is dropped, not even a leading blank line: the
+    stored steps point at line numbers in the corpus file, and a match has to
+    be right about them for the user's copy too.
+    """
+    lines = (line.rstrip() for line in code.replace("\r\n", "\n").replace("\r", "\n").split("\n"))
+    return "\n".join(lines).rstrip("\n")
+
+
+def fingerprint(code: str, language: str, version: str = "") -> bytes:
+    """16-byte digest of the normalized code, its language and the pipeline
+    version (so an index built by an older pipeline simply stops matching)."""
+    import hashlib
+
+    lang = (language or "python").lower()
+    text = f"{version}\0{lang}\0{normalize(code)}"
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def write(path: str, entries: Iterable[Tuple[bytes, Dict[str, Any]]]) -> int:
+    """Write an index of (fingerprint, response payload) pairs. Returns the
+    number of entries; a repeated fingerprint keeps the last payload."""
+    by_key = {key: json.dumps(payload, separators=(",", ":")).encode("utf-8") for key, payload in entries}
+    keys = sorted(by_key)
+
+    table = bytearray()
+    blobs = bytearray()
+    base = _HEADER.size + _ENTRY.size * len(keys)
+    for key in keys:
+        table += _ENTRY.pack(key, base + len(blobs), len(by_key[key]))
+        blobs += by_key[key]
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(_HEADER.pack(MAGIC, VERSION, len(keys)))
+        fh.write(table)
+        fh.write(blobs)
+    os.replace(tmp, path)  # readers never see a half-written index
+    return len(keys)
+
+
+class Index:
+    """A memory-mapped, read-only snippet index. A missing or unreadable file
+    gives an empty index, so the handler works the same without one."""
+
+    def __init__(self, path: str) -> None:
+        self._mm: Optional[mmap.mmap] = None
+        self._count = 0
+        try:
+            with open(path, "rb") as fh:
+                mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return  # absent, or empty (mmap can't map zero bytes)
+        if len(mm) < _HEADER.size:
+            mm.close()
+            return
+        magic, version, count = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION or len(mm) < _HEADER.size + count * _ENTRY.size:
+            mm.close()
+            return
+        self._mm, self._count = mm, count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get(self, key: bytes) -> Optional[Dict[str, Any]]:
+        """The payload stored under a fingerprint, or None."""
+        mm = self._mm
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            at = _HEADER.size + mid * _ENTRY.size
+            probe = mm[at:at + 16]  # type: ignore[index]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                _, offset, length = _ENTRY.unpack_from(mm, at)  # type: ignore[arg-type]
+                return json.loads(mm[offset:offset + length])  # type: ignore[index]
+        return None
+
+    def lookup(self, code: str, language: str, version: str = "") -> Optional[Dict[str, Any]]:
+        if not self._count:
+            return None
+        return self.get(fingerprint(code, language, version))
+
+
+def open_default() -> Index:
+    """The deployed index (CODELENS_SNIPPET_INDEX overrides the path)."""
+    return Index(os.getenv("CODELENS_SNIPPET_INDEX") or DEFAULT_PATH)
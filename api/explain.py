@@ -7,40 +7,227 @@ standard library so cold starts stay fast and there are no install steps.
 
 from __future__ import annotations
 
+import functools
 import json
 import os
 import sys
+import time
 from http.server import BaseHTTPRequestHandler
+from itertools import islice
+from urllib.parse import parse_qs, urlsplit
 
 # Make the sibling `_lib` package importable regardless of Vercel's CWD.
-sys.path.insert(0, os.path.dirname(__file__))
+_HERE = os.path.dirname(__file__)
+if _HERE not in sys.path:
+    sys.path.insert(0, _HERE)
 
-from _lib import ai, explainer, graph, parser, parser_js  # noqa: E402
+# Only the pieces every request needs are imported up front. The JS parser is
+# loaded on the first JS request and the AI layer (and with it urllib.request)
+# on the first request that reaches it, so a cold start only pays for what the
+# request actually uses. See benchmarks/bench_coldstart.py.
+from _lib import admission, explainer, graph, profiling, snippets  # noqa: E402
+from _lib.scope import WHOLE, Scope, from_params, source_lines  # noqa: E402
 
-MAX_CODE_BYTES = 100_000  # ~100 KB guards against oversized payloads.
+# Bodies are read in fixed-size chunks into one preallocated buffer, so memory
+# is bounded by the declared size, which is checked before reading anything.
+# 4 MB stays under Vercel's 4.5 MB request body cap.
+MAX_CODE_BYTES = 4 * 1024 * 1024
+_READ_CHUNK_BYTES = 64 * 1024
+# The body cap is for transport; what the analysis may chew on is smaller.
+# `ast` holds a whole Python file in memory at ~200 bytes per source byte (and
+# parses all of it even for a scoped request), so Python is capped tightly.
+# Whole-file JS/TS builds the full IR too; only a scoped JS/TS request, whose
+# parse stops past its range, may use the full body.
+_MAX_PYTHON_CHARS = 512 * 1024
+_MAX_WHOLE_FILE_CHARS = 1024 * 1024
+# A client that trickles its body slower than this is cut off (slow-loris).
+_READ_TIMEOUT_SEC = 10.0
 
+# Time a request may spend end to end (Vercel kills it at maxDuration = 30 s).
+_REQUEST_BUDGET_SEC = 25.0
+# Longest we queue for a parse slot before answering 429 instead.
+_PARSE_MAX_WAIT_SEC = 5.0
+# Longest we queue for a model slot before degrading to the heuristic.
+_AI_MAX_WAIT_SEC = 1.0
 
-def _build_response(code: str, language: str) -> dict:
-    lang = (language or "python").lower()
+# Bump whenever the response shape or wording changes, so ETags handed out by an
+# older deploy stop matching and clients re-fetch.
+PIPELINE_VERSION = "2"
+
+# Bodies smaller than this go out uncompressed; the headers would eat the win.
+_COMPRESS_MIN_BYTES = 1024
+
+# Inputs at least this large get a streamed response: steps and diagram lines
+# are encoded and written as they're produced instead of being built in full
+# first. Small inputs keep the simpler buffered path (and a Content-Length).
+_STREAM_MIN_CHARS = 256 * 1024
+# Encoded output is flushed to the socket in pieces of about this size.
+_STREAM_CHUNK_CHARS = 16 * 1024
+
+# Precomputed answers for canonical snippets (see scripts/build_snippet_index.py).
+# Mapping the file is all that happens here; nothing is parsed until a lookup.
+_SNIPPETS = snippets.open_default()
+
+_CORS_HEADERS = (
+    ("Access-Control-Allow-Origin", "*"),
+    ("Access-Control-Allow-Methods", "POST, OPTIONS"),
+    ("Access-Control-Allow-Headers", f"Content-Type, If-None-Match, X-Language, {profiling.HEADER}"),
+    ("Access-Control-Expose-Headers", "ETag, Retry-After"),
+)
+
+
+def _input_hash(code: str, language: str, scope: Scope = WHOLE) -> str:
+    """Short, stable fingerprint of a request's input (used to name profiles)."""
+    import hashlib
+
+    digest = hashlib.sha256(f"{(language or 'python').lower()}\0{scope.key()}\0{code}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _etag(code: str, language: str, scope: Scope = WHOLE) -> str:
+    """Validator for a response: same input + same pipeline -> same ETag.
+
+    Weak, because the same JSON goes out gzipped, brotli'd or plain under it.
+    """
+    return f'W/"{PIPELINE_VERSION}-{_input_hash(code, language, scope)}"'
+
+
+def _etag_matches(header: str | None, etag: str) -> bool:
+    """If-None-Match uses the weak comparison: W/ prefixes are ignored."""
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+@functools.lru_cache(maxsize=None)
+def _brotli():
+    """The optional `brotli` package, or None. Imported on first use only."""
+    try:
+        import brotli  # type: ignore[import-not-found]
+    except ImportError:
+        return None
+    return brotli
+
+
+def _negotiate_encoding(accept: str | None) -> str | None:
+    """Pick `br` or `gzip` from an Accept-Encoding header, honouring q=0."""
+    offered = {}
+    for part in (accept or "").split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name.strip():
+            offered[name.strip().lower()] = q
+
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and _brotli() is None:
+            continue
+        if offered.get(encoding, offered.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return _brotli().compress(body)
+    import zlib
+
+    # wbits=31 writes a gzip container (header + CRC) rather than raw zlib.
+    packer = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return packer.compress(body) + packer.flush()
+
+
+def _parse(code: str, lang: str, scope: Scope = WHOLE) -> dict:
+    """Source -> IR for a (lower-cased) language name."""
     if lang == "python":
-        ir = parser.parse_python_to_ir(code)
-    elif lang in ("javascript", "typescript"):
-        ir = parser_js.parse_jsts_to_ir(code)
-    else:
-        raise ValueError(f"Unsupported language: {language}")
+        from _lib import parser
+
+        return parser.parse_python_to_ir(code, scope)
+    if lang in ("javascript", "typescript"):
+        from _lib import parser_js
+
+        return parser_js.parse_jsts_to_ir(code, scope)
+    raise ValueError(f"Unsupported language: {lang}")
+
 
-    steps = explainer.explain_ir(ir)
+def _too_large(code: str, lang: str, scope: Scope) -> str | None:
+    """Why an input is too big to analyze, or None when it fits."""
+    if lang == "python" and len(code) > _MAX_PYTHON_CHARS:
+        return f"Python code is limited to {_MAX_PYTHON_CHARS // 1024} KB."
+    if scope.whole and len(code) > _MAX_WHOLE_FILE_CHARS:
+        return (f"Code over {_MAX_WHOLE_FILE_CHARS // 1024} KB can't be analyzed in full. "
+                "Pick a line range or a function.")
+    return None
+
+
+def _insights(code: str, steps: list, ir: dict, deadline: float) -> dict:
+    """Model insights, or the heuristic when the model stage is saturated."""
+    from _lib import ai
 
-    diagram = ""
     try:
-        diagram = graph.ir_to_mermaid(ir)
-    except Exception:
-        # A flowchart failure shouldn't sink the whole explanation.
+        with admission.AI.admit(min(deadline, time.monotonic() + _AI_MAX_WAIT_SEC)):
+            return ai.generate_insights(code, steps, ir)
+    except admission.Overloaded:
+        return ai.shed_insights(ir)
+
+
+def _build_response(code: str, language: str, deadline: float | None = None,
+                    scope: Scope = WHOLE) -> dict:
+    """The response payload for an input; see `_run_pipeline`."""
+    return _run_pipeline(code, language, deadline, scope)[0]
+
+
+def _run_pipeline(code: str, language: str, deadline: float | None = None,
+                  scope: Scope = WHOLE) -> tuple[dict, bool]:
+    """Run the pipeline under admission control: (payload, cacheable).
+
+    Canonical snippets are answered straight from the precomputed index.
+    Otherwise, parsing waits for a CPU slot (raising `admission.Overloaded` if none frees
+    up in time). If the model stage is saturated we skip the model call and
+    return the heuristic insights, so the deterministic output stays fast
+    under load.
+
+    A `scope` limits the whole pipeline, model prompt included, to the
+    top-level statements it selects; the response then echoes the lines covered.
+
+    `cacheable` is False when the insights are a stand-in for a model answer
+    that failed or was shed: the same input may well get a better one next
+    time, so it mustn't be pinned by an ETag.
+    """
+    lang = (language or "python").lower()
+    if scope.whole:
+        known = _SNIPPETS.lookup(code, lang, PIPELINE_VERSION)
+        if known is not None:
+            return {**known, "language": lang}, True
+
+    now = time.monotonic()
+    if deadline is None:
+        deadline = now + _REQUEST_BUDGET_SEC
+
+    with admission.PARSE.admit(min(deadline, now + _PARSE_MAX_WAIT_SEC)):
+        ir = _parse(code, lang, scope)
+        steps = explainer.explain_ir(ir)
+
         diagram = ""
+        try:
+            diagram = graph.ir_to_mermaid(ir)
+        except Exception:
+            # A flowchart failure shouldn't sink the whole explanation.
+            diagram = ""
 
-    insights = ai.generate_insights(code, steps, ir)
+    span = ir.get("scope")
+    if span is not None:
+        code = source_lines(code, span["start_line"], span["end_line"], lang)
+    insights = _insights(code, steps, ir, deadline)
 
-    return {
+    payload = {
         "language": lang,
         "summary": insights["summary"],
         "complexity": insights["complexity"],
@@ -48,24 +235,188 @@ def _build_response(code: str, language: str) -> dict:
         "steps": steps,
         "diagram": diagram,
     }
+    if span is not None:
+        payload["scope"] = span
+    return payload, not insights.get("fallback")
+
+
+class _StreamWriter:
+    """Buffers small JSON fragments into socket-sized writes, optionally
+    compressing them on the fly."""
+
+    def __init__(self, wfile, encoding: str | None) -> None:
+        self._wfile = wfile
+        self._buf: list[str] = []
+        self._size = 0
+        self._compress = self._finish = None
+        if encoding == "br":
+            packer = _brotli().Compressor()
+            self._compress, self._finish = packer.process, packer.finish
+        elif encoding == "gzip":
+            import zlib
+
+            packer = zlib.compressobj(6, zlib.DEFLATED, 31)
+            self._compress, self._finish = packer.compress, packer.flush
+
+    def write(self, text: str) -> None:
+        self._buf.append(text)
+        self._size += len(text)
+        if self._size >= _STREAM_CHUNK_CHARS:
+            self.flush()
+
+    def flush(self) -> None:
+        data = "".join(self._buf).encode("utf-8")
+        self._buf, self._size = [], 0
+        if self._compress is not None:
+            data = self._compress(data)
+        if data:
+            self._wfile.write(data)
+
+    def close(self) -> None:
+        self.flush()
+        if self._finish is not None:
+            self._wfile.write(self._finish())
 
 
 class handler(BaseHTTPRequestHandler):
-    def _send(self, status: int, payload: dict) -> None:
+    # Applied to the socket by StreamRequestHandler: bounds every single read,
+    # while `_read_body` bounds the body as a whole.
+    timeout = _READ_TIMEOUT_SEC
+
+    def _send(self, status: int, payload: dict, etag: str | None = None,
+              headers: tuple = ()) -> None:
         body = json.dumps(payload).encode("utf-8")
+        encoding = None
+        if status == 200 and len(body) >= _COMPRESS_MIN_BYTES:
+            encoding = _negotiate_encoding(self.headers.get("Accept-Encoding"))
+            if encoding:
+                body = _compress(body, encoding)
+
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        for name, value in _CORS_HEADERS:
+            self.send_header(name, value)
+        if status == 200:
+            self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        if etag:
+            self.send_header("ETag", etag)
+        for name, value in headers:
+            self.send_header(name, value)
         self.send_header("Content-Length", str(len(body)))
         self.end_headers()
         self.wfile.write(body)
 
+    def _send_not_modified(self, etag: str) -> None:
+        self.send_response(304)
+        for name, value in _CORS_HEADERS:
+            self.send_header(name, value)
+        self.send_header("ETag", etag)
+        self.end_headers()
+
+    def _stream_response(self, code: str, language: str, deadline: float) -> None:
+        """Explain a large input, writing JSON as the walk produces it.
+
+        Same fields as `_build_response`, but `steps` and `diagram` come first
+        and go out incrementally; the insights (which wait on the model) close
+        the object. Parsing happens before the status line, so syntax errors
+        and overload still get their usual responses. There is no ETag: the
+        headers leave before we know whether the insights are a fallback.
+        """
+        lang = (language or "python").lower()
+        with admission.PARSE.admit(min(deadline, time.monotonic() + _PARSE_MAX_WAIT_SEC)):
+            ir = _parse(code, lang)
+
+        # The slot covers the parse only. Everything below writes to the
+        # socket, and a client reading slowly must not hold CPU capacity while
+        # we wait on it; the walks are cheap next to the parse.
+        encoding = _negotiate_encoding(self.headers.get("Accept-Encoding"))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        for name, value in _CORS_HEADERS:
+            self.send_header(name, value)
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        # No Content-Length: the body ends when the connection closes.
+        self.close_connection = True
+        self.end_headers()
+
+        # Past this point the status line is out, so failures can't become
+        # an error response; the client sees a truncated body instead.
+        out = _StreamWriter(self.wfile, encoding)
+        try:
+            out.write(f'{{"language": {json.dumps(lang)}, "steps": [')
+            for i, step in enumerate(explainer.iter_explain_ir(ir)):
+                out.write(", " + json.dumps(step) if i else json.dumps(step))
+            out.write('], "diagram": "')
+            try:
+                for i, line in enumerate(graph.iter_mermaid(ir)):
+                    # Each line is the inside of a JSON string, joined by an escaped newline.
+                    out.write(("\\n" if i else "") + json.dumps(line)[1:-1])
+            except Exception:
+                # End the diagram where it stopped rather than failing the
+                # whole explanation (the buffered path would send "").
+                pass
+            out.write('"')
+        except Exception:
+            self.log_error("streamed response aborted")
+            return
+
+        # The model only ever sees the first few steps; re-walking those is
+        # cheaper than having kept every step around.
+        try:
+            insights = _insights(code, list(islice(explainer.iter_explain_ir(ir), 40)), ir, deadline)
+            out.write(", " + json.dumps({
+                "summary": insights["summary"],
+                "complexity": insights["complexity"],
+                "ai": insights["ai"],
+            })[1:])
+            out.close()
+        except Exception:
+            self.log_error("streamed response aborted")
+
     def do_OPTIONS(self) -> None:  # noqa: N802 - required handler name
         self._send(204, {})
 
-    def do_POST(self) -> None:  # noqa: N802 - required handler name
+    def _read_body(self, length: int) -> bytearray | None:
+        """Read exactly `length` bytes in chunks, enforcing the read deadline.
+
+        Returns None (after answering 408/400) when the client is too slow or
+        hangs up early.
+        """
+        buf = bytearray(length)
+        view = memoryview(buf)
+        pos = 0
+        started = time.monotonic()
+        try:
+            while pos < length:
+                if time.monotonic() - started > _READ_TIMEOUT_SEC:
+                    raise TimeoutError
+                got = self.rfile.readinto(view[pos:pos + _READ_CHUNK_BYTES])
+                if not got:
+                    self._send(400, {"error": "Request body ended early."})
+                    return None
+                pos += got
+        except (TimeoutError, OSError):
+            self._send(408, {"error": "Request body took too long to arrive."})
+            return None
+        finally:
+            view.release()
+        return buf
+
+    def _read_input(self) -> tuple[str, str, Scope] | None:
+        """Return (code, language, scope) from the body, or None after answering 4xx.
+
+        Two modes: the default `{ code, language }` JSON body, and a raw
+        `text/plain` upload of the source itself, with the language taken from
+        the `?language=` query parameter or an `X-Language` header. The raw
+        mode skips the JSON wrapper, its escaping and its extra copies.
+
+        Either mode may narrow the analysis with `start_line`, `end_line` and
+        `function` (JSON fields, or query parameters for raw uploads).
+        """
         try:
             length = int(self.headers.get("Content-Length", 0))
         except (TypeError, ValueError):
@@ -74,22 +425,82 @@ class handler(BaseHTTPRequestHandler):
         if length <= 0 or length > MAX_CODE_BYTES:
             # Generic client-facing message; no internal details leaked.
             self._send(400, {"error": "Request body missing or too large."})
-            return
+            return None
+
+        raw = self._read_body(length)
+        if raw is None:
+            return None
+
+        content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if content_type == "text/plain":
+            query = {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+            language = query.get("language") or self.headers.get("X-Language") or "python"
+            scope = self._scope(query)
+            if scope is None:
+                return None
+            try:
+                return raw.decode("utf-8"), language, scope
+            except UnicodeDecodeError:
+                self._send(400, {"error": "Code must be UTF-8 text."})
+                return None
 
         try:
-            data = json.loads(self.rfile.read(length).decode("utf-8"))
-            code = data.get("code", "")
-            language = data.get("language", "python")
+            data = json.loads(raw)
         except (json.JSONDecodeError, UnicodeDecodeError):
+            data = None
+        del raw  # Drop the byte copy before analysis starts.
+        if not isinstance(data, dict):
             self._send(400, {"error": "Invalid JSON body."})
+            return None
+        language = data.get("language") or "python"
+        if not isinstance(language, str):
+            self._send(400, {"error": "language must be a string."})
+            return None
+        scope = self._scope(data)
+        if scope is None:
+            return None
+        return data.get("code", ""), language, scope
+
+    def _scope(self, params: dict) -> Scope | None:
+        """The requested scope, or None after answering 400."""
+        try:
+            return from_params(params.get("start_line"), params.get("end_line"), params.get("function"))
+        except ValueError as exc:
+            self._send(400, {"error": str(exc)})
+            return None
+
+    def do_POST(self) -> None:  # noqa: N802 - required handler name
+        deadline = time.monotonic() + _REQUEST_BUDGET_SEC
+        parsed = self._read_input()
+        if parsed is None:
             return
+        code, language, scope = parsed
 
         if not isinstance(code, str) or not code.strip():
             self._send(400, {"error": "No code provided."})
             return
+        too_large = _too_large(code, language.lower(), scope)
+        if too_large:
+            self._send(400, {"error": too_large})
+            return
+
+        # Identical input on the same pipeline: the client already has the answer.
+        etag = _etag(code, language, scope)
+        if _etag_matches(self.headers.get("If-None-Match"), etag):
+            self._send_not_modified(etag)
+            return
 
+        profile = {"key": _input_hash(code, language, scope), "token": self.headers.get(profiling.HEADER)}
         try:
-            self._send(200, _build_response(code, language))
+            # A scoped answer is sized by the scope, not the file: no need to stream it.
+            if scope.whole and len(code) >= _STREAM_MIN_CHARS:
+                profiling.call(self._stream_response, code, language, deadline, **profile)
+                return
+            payload, cacheable = profiling.call(_run_pipeline, code, language, deadline, scope, **profile)
+            self._send(200, payload, etag=etag if cacheable else None)
+        except admission.Overloaded as exc:
+            self._send(429, {"error": "The server is busy. Please try again shortly."},
+                       headers=(("Retry-After", str(exc.retry_after)),))
         except SyntaxError as exc:
             # Surface only the line/offset, not internal tracebacks.
             self._send(200, {"error": f"Could not parse the code: {exc.msg}"})
@@ -0,0 +1,183 @@
+"""Vercel serverless function: POST /api/project.
+
+Project mode. Upload a zip of a project (`Content-Type: application/zip`) and
+get back its symbol index: every file, every top-level function and the calls
+between them, across modules. Add `?symbol=pkg.mod.func` to get one function's
+steps, diagram and Big-O instead.
+
+The index is kept in memory, keyed by the zip's hash and returned as `project`,
+so follow-up questions can skip the upload: POST
+`{"project": "<key>", "symbol": "..."}`. A warm instance answers those from
+the index without re-parsing anything; a cold or recycled one says 404 and the
+client uploads again.
+
+Shares the plumbing of /api/explain (body limits, compression, CORS, overload
+handling) by extending its handler.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import posixpath
+import sys
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+
+_HERE = os.path.dirname(__file__)
+if _HERE not in sys.path:
+    sys.path.insert(0, _HERE)
+
+import explain  # noqa: E402
+from _lib import admission, project  # noqa: E402
+
+# Limits on what an upload may unpack to (the zip itself is capped at
+# explain.MAX_CODE_BYTES like any body). Sizes in the zip directory are checked
+# first and then enforced while reading, so a lying header can't inflate past them.
+_MAX_FILES = 2000
+_MAX_UNPACKED_BYTES = 32 * 1024 * 1024
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+# Indexes kept per instance, least recently used dropped first.
+_CACHE_SIZE = _env_int("CODELENS_PROJECT_CACHE", 4)
+# Parse processes per upload. Serverless instances have little to spare, so
+# inline by default; self-hosted deployments can raise it.
+_WORKERS = _env_int("CODELENS_PROJECT_WORKERS", 1)
+
+_cache: "OrderedDict[str, project.ProjectIndex]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cached(key: str) -> project.ProjectIndex | None:
+    with _cache_lock:
+        index = _cache.get(key)
+        if index is not None:
+            _cache.move_to_end(key)
+        return index
+
+
+def _remember(key: str, index: project.ProjectIndex) -> None:
+    with _cache_lock:
+        _cache[key] = index
+        _cache.move_to_end(key)
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _unpack(data: bytes) -> list:
+    """(path, source) for each parseable file in a zip. Raises ValueError with a
+    client-safe message for anything malformed or over the limits."""
+    import zipfile
+
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise ValueError("The upload is not a valid zip file.") from None
+
+    members = []
+    for info in archive.infolist():
+        path = posixpath.normpath(info.filename.replace("\\", "/"))
+        parts = path.split("/")
+        if (info.is_dir() or path.startswith(("/", "../")) or path == ".."
+                or any(p in project.SKIP_DIRS or p.startswith(".") for p in parts[:-1])
+                or project.language_for(path) is None):
+            continue
+        members.append((path, info))
+    if len(members) > _MAX_FILES:
+        raise ValueError(f"The project has more than {_MAX_FILES} source files.")
+    if sum(info.file_size for _, info in members) > _MAX_UNPACKED_BYTES:
+        raise ValueError("The project is too large to analyze.")
+
+    # Zips of a folder put everything under one directory; drop it so module
+    # names start where the project does.
+    roots = {path.split("/", 1)[0] for path, _ in members}
+    strip = len(roots) == 1 and all("/" in path for path, _ in members)
+
+    files = []
+    budget = _MAX_UNPACKED_BYTES
+    for path, info in members:
+        with archive.open(info) as fh:
+            raw = fh.read(budget + 1)
+        budget -= len(raw)
+        if budget < 0:
+            raise ValueError("The project is too large to analyze.")
+        files.append((path.split("/", 1)[1] if strip else path, raw.decode("utf-8", errors="replace")))
+    return files
+
+
+def _answer(key: str, index: project.ProjectIndex, symbol: object, deadline: float) -> dict:
+    if symbol is not None and not isinstance(symbol, str):
+        raise ValueError("symbol must be a function name.")
+    if symbol:
+        # Explaining walks the function and its callees, which is CPU work like
+        # parsing, so it takes a parse slot under the same deadline as a build.
+        with admission.PARSE.admit(min(deadline, time.monotonic() + explain._PARSE_MAX_WAIT_SEC)):
+            return {"project": key, **index.explain(symbol)}
+    return {"project": key, **index.summary()}
+
+
+class handler(explain.handler):
+    def _read_bytes(self) -> bytes | None:
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except (TypeError, ValueError):
+            length = 0
+        if length <= 0 or length > explain.MAX_CODE_BYTES:
+            self._send(400, {"error": "Request body missing or too large."})
+            return None
+        raw = self._read_body(length)
+        return None if raw is None else bytes(raw)
+
+    def do_POST(self) -> None:  # noqa: N802 - required handler name
+        deadline = time.monotonic() + explain._REQUEST_BUDGET_SEC
+        raw = self._read_bytes()
+        if raw is None:
+            return
+
+        content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        try:
+            if content_type in ("application/zip", "application/x-zip-compressed"):
+                symbol = (parse_qs(urlsplit(self.path).query).get("symbol") or [None])[0]
+                key = hashlib.sha256(raw).hexdigest()[:16]
+                index = _cached(key)
+                if index is None:
+                    files = _unpack(raw)
+                    del raw
+                    with admission.PARSE.admit(min(deadline, time.monotonic() + explain._PARSE_MAX_WAIT_SEC)):
+                        index = project.build(files, workers=_WORKERS)
+                    _remember(key, index)
+                self._send(200, _answer(key, index, symbol, deadline))
+                return
+
+            try:
+                data = json.loads(raw)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                data = None
+            if not isinstance(data, dict) or not isinstance(data.get("project"), str):
+                self._send(400, {"error": "Upload a zip, or send {project, symbol} as JSON."})
+                return
+            index = _cached(data["project"])
+            if index is None:
+                self._send(404, {"error": "Unknown or expired project. Please upload it again."})
+                return
+            self._send(200, _answer(data["project"], index, data.get("symbol"), deadline))
+        except project.UnknownSymbol as exc:
+            self._send(404, {"error": str(exc)})
+        except admission.Overloaded as exc:
+            self._send(429, {"error": "The server is busy. Please try again shortly."},
+                       headers=(("Retry-After", str(exc.retry_after)),))
+        except ValueError as exc:
+            self._send(400, {"error": str(exc)})
+        except Exception:
+            self._send(500, {"error": "Something went wrong while analyzing the project."})
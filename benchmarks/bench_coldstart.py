@@ -0,0 +1,91 @@
+"""Cold-start benchmark for the serverless function.
+
+Spawns fresh interpreters with `python -X importtime`, imports `explain` the way
+Vercel does and runs one Python-only request through the deterministic stages
+(parse -> steps -> diagram). Reports the median cumulative import time, the
+slowest modules, and which heavyweight modules were (wrongly) loaded.
+
+    python benchmarks/bench_coldstart.py [--runs 7] [--budget-ms 60]
+
+Exits non-zero when the median `import explain` time exceeds the budget, so it
+can gate CI. The default budget leaves headroom over the ~45 ms measured on a
+typical laptop, most of which is the unavoidable `http.server` import.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+API_DIR = os.path.join(os.path.dirname(__file__), "..", "api")
+
+# A Python-only request should never load these; they belong to other paths.
+_LAZY_MODULES = ("_lib.parser_js", "_lib.ai", "urllib.request", "cProfile", "tracemalloc")
+
+_SCRIPT = """
+import sys
+import explain
+from _lib import parser
+ir = parser.parse_python_to_ir("def f(a):\\n    for x in a:\\n        print(x)\\n")
+explain.explainer.explain_ir(ir)
+explain.graph.ir_to_mermaid(ir)
+print(",".join(m for m in {lazy!r} if m in sys.modules))
+"""
+
+
+def _parse_importtime(stderr: str) -> Dict[str, Tuple[int, int]]:
+    """Map module name -> (self us, cumulative us) from -X importtime output."""
+    out: Dict[str, Tuple[int, int]] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        out[name] = (int(self_us), int(cum_us))
+    return out
+
+
+def run_once() -> Tuple[Dict[str, Tuple[int, int]], List[str]]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _SCRIPT.format(lazy=_LAZY_MODULES)],
+        cwd=API_DIR, capture_output=True, text=True, check=True,
+    )
+    loaded = [m for m in proc.stdout.strip().split(",") if m]
+    return _parse_importtime(proc.stderr), loaded
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--runs", type=int, default=7)
+    ap.add_argument("--budget-ms", type=float, default=60.0)
+    ap.add_argument("--top", type=int, default=10)
+    args = ap.parse_args()
+
+    totals: List[int] = []
+    last: Dict[str, Tuple[int, int]] = {}
+    leaked: List[str] = []
+    for _ in range(args.runs):
+        last, leaked = run_once()
+        totals.append(last.get("explain", (0, 0))[1])
+
+    median_ms = statistics.median(totals) / 1000
+    print(f"import explain: median {median_ms:.1f} ms over {args.runs} runs "
+          f"(min {min(totals) / 1000:.1f}, max {max(totals) / 1000:.1f}; budget {args.budget_ms:.0f} ms)")
+
+    print("\nslowest modules by self time (last run):")
+    for name, (self_us, cum_us) in sorted(last.items(), key=lambda kv: -kv[1][0])[:args.top]:
+        print(f"  {self_us / 1000:7.2f} ms self  {cum_us / 1000:7.2f} ms cumulative  {name}")
+
+    if leaked:
+        print(f"\nloaded on the Python-only path but should be lazy: {', '.join(leaked)}")
+    else:
+        print("\nlazy modules stayed unloaded: " + ", ".join(_LAZY_MODULES))
+
+    return 1 if median_ms > args.budget_ms or leaked else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
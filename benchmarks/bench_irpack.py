@@ -0,0 +1,91 @@
+"""Size and speed of the binary IR encoding against JSON and pickle.
+
+Builds IRs from real sources in this repo (the largest Python module, all of
+the Python API together, and the React app), then times encode/decode for
+`_lib.irpack`, `json` and `pickle` (protocol 5) and reports the encoded sizes,
+raw and gzipped.
+
+Inputs are never made by repeating a source: irpack stores each distinct string
+once, so N copies of one file would flatter it by roughly N.
+
+    python benchmarks/bench_irpack.py [--repeat 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import pickle
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "api"))
+
+from _lib import irpack, parser, parser_js  # noqa: E402
+
+Codec = Tuple[str, Callable[[Any], bytes], Callable[[bytes], Any]]
+
+CODECS: List[Codec] = [
+    ("irpack", irpack.encode, irpack.decode),
+    ("json", lambda ir: json.dumps(ir, separators=(",", ":")).encode("utf-8"), json.loads),
+    ("pickle", lambda ir: pickle.dumps(ir, protocol=5), pickle.loads),
+]
+
+
+def _read(path: str) -> str:
+    with open(path, encoding="utf-8") as fh:
+        return fh.read()
+
+
+def _sources() -> Dict[str, Tuple[str, Callable[[str], Dict[str, Any]]]]:
+    paths = sorted(glob.glob(os.path.join(ROOT, "api", "**", "*.py"), recursive=True))
+    largest = max(paths, key=os.path.getsize)
+    return {
+        f"py {os.path.basename(largest)}": (_read(largest), parser.parse_python_to_ir),
+        "py all of api/": ("\n\n".join(_read(p) for p in paths), parser.parse_python_to_ir),
+        "js App.jsx": (_read(os.path.join(ROOT, "frontend", "src", "App.jsx")), parser_js.parse_jsts_to_ir),
+    }
+
+
+def _median_ms(fn: Callable[[], Any], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    sources = _sources()
+    print(f"{'input':<22}{'codec':<8}{'bytes':>11}{'gzipped':>10}{'encode ms':>11}{'decode ms':>11}")
+    for label, (source, parse) in sources.items():
+        ir = parse(source)
+        for name, enc, dec in CODECS:
+            blob = enc(ir)
+            assert dec(blob) == ir, f"{name} did not round-trip"
+            print(f"{label:<22}{name:<8}{len(blob):>11,}{len(gzip.compress(blob)):>10,}"
+                  f"{_median_ms(lambda: enc(ir), args.repeat):>11.2f}"
+                  f"{_median_ms(lambda: dec(blob), args.repeat):>11.2f}")
+            label = ""
+
+    # The columns alone can be read without decoding the tree.
+    source, parse = sources["py all of api/"]
+    blob = irpack.encode(parse(source))
+    ms = _median_ms(lambda: sum(1 for k in irpack.IRView(blob).kinds() if k in ("For", "While")), args.repeat)
+    print(f"\nIRView loop count over the kind column (all of api/): {ms:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
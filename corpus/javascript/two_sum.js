@@ -0,0 +1,9 @@
+function twoSum(nums, target) {
+  const seen = {};
+  for (let i = 0; i < nums.length; i++) {
+    const x = nums[i];
+    if ((target - x) in seen) return [seen[target - x], i];
+    seen[x] = i;
+  }
+  return [];
+}
@@ -0,0 +1,7 @@
+def max_subarray(nums):
+    best = nums[0]
+    current = nums[0]
+    for x in nums[1:]:
+        current = max(x, current + x)
+        best = max(best, current)
+    return best
@@ -0,0 +1,70 @@
+"""Build the precomputed snippet index served by /api/explain.
+
+Runs the full pipeline, model insights included, over every snippet in the
+curated corpus and writes the responses to a memory-mappable index keyed by
+each snippet's normalized fingerprint (see api/_lib/snippets.py).
+
+    python scripts/build_snippet_index.py [--corpus corpus] [--out api/_data/snippets.idx]
+
+Set GEMINI_API_KEY for the best summaries. By default the static complexity
+shortcut is disabled here so every entry gets a model-written summary; pass
+--allow-static to keep it. Entries whose model call failed are reported and
+left out of the index (the live pipeline answers those), and the build is
+cheap to re-run.
+
+The deploy runs this as part of `buildCommand` in vercel.json, so the index
+always matches the explain.PIPELINE_VERSION being shipped; an index from an
+older pipeline no longer matches anything.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+_LANGUAGES = {".py": "python", ".js": "javascript", ".ts": "typescript"}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--corpus", default=os.path.join(ROOT, "corpus"))
+    ap.add_argument("--out", default=None, help="defaults to api/_data/snippets.idx")
+    ap.add_argument("--allow-static", action="store_true",
+                    help="let confident static analysis skip the model call")
+    args = ap.parse_args()
+
+    if not args.allow_static:
+        # Read by _lib.ai at import time, so set it before importing explain.
+        os.environ["CODELENS_STATIC_CONFIDENCE"] = "2"
+    # Build from scratch: an existing index must not answer for itself.
+    os.environ["CODELENS_SNIPPET_INDEX"] = os.devnull
+    sys.path.insert(0, os.path.join(ROOT, "api"))
+    import explain
+    from _lib import snippets
+
+    entries = []
+    for folder, _, files in sorted(os.walk(args.corpus)):
+        for name in sorted(files):
+            language = _LANGUAGES.get(os.path.splitext(name)[1])
+            if language is None:
+                continue
+            path = os.path.join(folder, name)
+            with open(path, encoding="utf-8") as fh:
+                code = fh.read()
+            payload, cacheable = explain._run_pipeline(code, language)
+            marker = "ai" if payload["ai"] else "static" if cacheable else "FAILED"
+            print(f"  {marker:<6} {payload['complexity']:<40} {os.path.relpath(path, args.corpus)}")
+            if cacheable:  # a failed model call is left for the live pipeline to retry
+                entries.append((snippets.fingerprint(code, language, explain.PIPELINE_VERSION), payload))
+
+    out = args.out or snippets.DEFAULT_PATH
+    count = snippets.write(out, entries)
+    print(f"wrote {count} entries to {os.path.relpath(out)} ({os.path.getsize(out):,} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
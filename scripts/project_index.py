@@ -0,0 +1,79 @@
+"""Index a project directory and explain its functions from the command line.
+
+Parses every Python / JS / TS file under DIR in parallel (see
+api/_lib/project.py) and prints the symbol index: files, functions and the
+calls between them. With --symbol it prints one function's steps, Big-O and
+callers/callees instead, served from the same index without re-parsing.
+
+    python scripts/project_index.py DIR [--symbol pkg.mod.func ...] [--workers N] [--json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "api"))
+
+from _lib import project  # noqa: E402
+
+
+def _print_summary(index: project.ProjectIndex) -> None:
+    summary = index.summary()
+    for f in summary["files"]:
+        status = f"error: {f['error']}" if f["error"] else f"{f['functions']} functions"
+        print(f"  {f['path']:<50} {status}")
+    cross = [c for c in summary["calls"] if c["cross_module"]]
+    print(f"\n{len(summary['symbols'])} functions, {len(summary['calls'])} call edges "
+          f"({len(cross)} across modules)")
+    for call in cross:
+        print(f"  {call['from']} -> {call['to']}")
+
+
+def _print_symbol(answer: dict) -> None:
+    sym = answer["symbol"]
+    print(f"{sym['name']}  ({sym['path']}:{sym['line']})")
+    print(f"  complexity: {answer['complexity']} (confidence {answer['confidence']})")
+    print(f"  calls:      {', '.join(answer['calls']) or '-'}")
+    print(f"  called by:  {', '.join(answer['called_by']) or '-'}")
+    for step in answer["steps"]:
+        print(f"  {'  ' * step['indent']}{step['line'] or '':>4}  {step['text']}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("directory")
+    ap.add_argument("--symbol", action="append", default=[],
+                    help="function to explain (qualified, or a unique bare name); repeatable")
+    ap.add_argument("--workers", type=int, default=None, help="parse processes (default: CPU count)")
+    ap.add_argument("--json", action="store_true", help="print JSON instead of text")
+    args = ap.parse_args()
+
+    started = time.perf_counter()
+    index = project.build(project.iter_directory(args.directory), workers=args.workers)
+    elapsed = time.perf_counter() - started
+
+    try:
+        answers = [index.explain(name) for name in args.symbol]
+    except project.UnknownSymbol as exc:
+        print(exc, file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps(answers if args.symbol else index.summary(), indent=2))
+        return 0
+    print(f"indexed {len(index.files)} files in {elapsed * 1000:.0f} ms")
+    if not args.symbol:
+        _print_summary(index)
+    for answer in answers:
+        print()
+        _print_symbol(answer)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
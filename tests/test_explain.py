@@ -0,0 +1,511 @@
+"""Tests for the serverless handler's plumbing (profiling hooks and friends).
+
+Like test_parser.py these never touch the network. Run them with
+`python tests/test_explain.py` or `pytest`.
+"""
+
+import gzip
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Make the serverless `_lib` package importable from the repo root.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+import explain  # noqa: E402
+from _lib import admission, ai, parser, profiling, snippets  # noqa: E402
+
+
+def _with_env(env, fn):
+    """Run `fn` with temporary environment overrides, restoring them after."""
+    saved = {k: os.environ.get(k) for k in env}
+    os.environ.update(env)
+    try:
+        return fn()
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def _handler(body=b"", headers=None):
+    """An `explain.handler` wired to in-memory streams instead of a socket.
+
+    Returns (handler, output buffer). Call a `do_*` method (or `_send`) and
+    then `_response` to split the raw bytes into status, headers and body.
+    """
+    headers = {"Content-Length": str(len(body)), **(headers or {})}
+    head = "POST /api/explain HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+    h = explain.handler.__new__(explain.handler)
+    h.rfile = io.BytesIO(head.encode("latin-1") + b"\r\n" + body)
+    h.wfile = io.BytesIO()
+    h.client_address = ("127.0.0.1", 0)
+    h.log_message = lambda *args: None
+    h.raw_requestline = h.rfile.readline()
+    h.parse_request()
+    return h, h.wfile
+
+
+def _response(out):
+    head, _, body = out.getvalue().partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    return status, headers, body
+
+
+def test_profiling_is_a_passthrough_when_disabled():
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {"CODELENS_PROFILE": "", "CODELENS_PROFILE_DIR": tmp}
+        result = _with_env(env, lambda: profiling.call(sum, [1, 2, 3], key="abc"))
+        assert result == 6
+        assert os.listdir(tmp) == []
+
+
+def test_profiling_admin_header_dumps_named_captures():
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            "CODELENS_PROFILE": "cpu,mem",
+            "CODELENS_PROFILE_TOKEN": "s3cret",
+            "CODELENS_PROFILE_RATE": "0",
+            "CODELENS_PROFILE_DIR": tmp,
+        }
+        result = _with_env(env, lambda: profiling.call(sum, [1, 2], key="deadbeef", token="s3cret"))
+        assert result == 3
+        names = sorted(os.listdir(tmp))
+        assert [n.split(".")[-1] for n in names] == ["pstats", "tracemalloc"]
+        assert all("-deadbeef." in n for n in names)
+
+        # A wrong token with no sampling captures nothing new, even one with
+        # bytes a latin-1 decoded header can carry.
+        _with_env(env, lambda: profiling.call(sum, [1], key="other", token="nope"))
+        assert _with_env(env, lambda: profiling.call(sum, [4], key="other", token="s3cr\xe9t")) == 4
+        assert len(os.listdir(tmp)) == 2
+
+
+def test_profiling_rotation_keeps_directory_bounded():
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            "CODELENS_PROFILE": "cpu",
+            "CODELENS_PROFILE_RATE": "1",
+            "CODELENS_PROFILE_DIR": tmp,
+            "CODELENS_PROFILE_MAX_BYTES": "1",
+        }
+        for i in range(3):
+            _with_env(env, lambda: profiling.call(sum, [i], key=f"k{i}"))
+        assert os.listdir(tmp) == []
+
+
+def test_profiling_concurrent_requests_capture_one_at_a_time():
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {"CODELENS_PROFILE": "cpu,mem", "CODELENS_PROFILE_RATE": "1", "CODELENS_PROFILE_DIR": tmp}
+        inside, release, results = threading.Event(), threading.Event(), []
+
+        def slow(x):
+            inside.set()
+            release.wait(5)
+            return x
+
+        def first():
+            results.append(profiling.call(slow, "first", key="one"))
+
+        def second():
+            inside.wait(5)
+            # Selected too, but the first capture is still running: no
+            # profiler clash, no tracemalloc stop under the first one.
+            results.append(profiling.call(sum, [1, 2], key="two"))
+            release.set()
+
+        def run_both():
+            threads = [threading.Thread(target=first), threading.Thread(target=second)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(10)
+
+        _with_env(env, run_both)
+        assert sorted(map(str, results)) == ["3", "first"]
+        assert sorted(n.split(".")[-1] for n in os.listdir(tmp)) == ["pstats", "tracemalloc"]
+        assert all("-one." in n for n in os.listdir(tmp))
+
+
+def test_cold_import_defers_js_parser_and_network_stack():
+    api_dir = os.path.join(os.path.dirname(__file__), "..", "api")
+    probe = ("import sys, explain; "
+             "print([m for m in ('_lib.parser_js', '_lib.ai', 'urllib.request') if m in sys.modules])")
+    out = subprocess.run([sys.executable, "-c", probe], cwd=api_dir,
+                         capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
+
+
+def test_matching_if_none_match_short_circuits_with_304():
+    code = "def f(a):\n    return a"
+    body = json.dumps({"code": code, "language": "python"}).encode()
+    etag = explain._etag(code, "python")
+    h, out = _handler(body, {"If-None-Match": f'"stale", {etag}'})
+    h.do_POST()
+    status, headers, payload = _response(out)
+    assert status == 304
+    assert headers["ETag"] == etag and payload == b""
+
+
+def test_etag_tracks_input_and_pipeline_version():
+    assert explain._etag("x = 1", "python") == explain._etag("x = 1", "Python")
+    assert explain._etag("x = 1", "python") != explain._etag("x = 2", "python")
+    assert explain._etag("x = 1", "python").startswith(f'W/"{explain.PIPELINE_VERSION}-')
+    # Weak comparison: a client echoing the tag without W/ still matches.
+    assert explain._etag_matches(explain._etag("x = 1", "python")[2:], explain._etag("x = 1", "python"))
+
+
+def test_fallback_insights_are_not_pinned_by_an_etag():
+    code = "def f(a):\n    while True:\n        a = step(a)"  # too unsure to skip the model
+    body = json.dumps({"code": code, "language": "python"}).encode()
+    saved = admission.AI
+    admission.AI = admission.Stage("ai", limit=1, max_queue=0)
+    try:
+        with admission.AI.admit(time.monotonic() + 1):
+            h, out = _handler(body)
+            h.do_POST()
+    finally:
+        admission.AI = saved
+    status, headers, payload = _response(out)
+    # Shed to the heuristic: a later request may get the model's answer.
+    assert status == 200 and json.loads(payload)["ai"] is False
+    assert "ETag" not in headers
+
+
+def test_large_responses_are_gzipped_when_accepted():
+    payload = {"steps": [{"indent": 0, "line": i, "text": "Loop over nums."} for i in range(200)]}
+    h, out = _handler(headers={"Accept-Encoding": "br;q=0, gzip;q=0.8"})
+    h._send(200, payload, etag='"1-abc"')
+    status, headers, body = _response(out)
+    assert status == 200 and headers["Content-Encoding"] == "gzip"
+    assert headers["Vary"] == "Accept-Encoding" and headers["ETag"] == '"1-abc"'
+    assert int(headers["Content-Length"]) == len(body)
+    assert json.loads(gzip.decompress(body)) == payload
+
+
+def test_small_or_unaccepted_responses_stay_plain():
+    h, out = _handler(headers={"Accept-Encoding": "gzip"})
+    h._send(200, {"ok": True})
+    assert "Content-Encoding" not in _response(out)[1]
+
+    big = {"text": "x" * 5000}
+    h, out = _handler(headers={"Accept-Encoding": "identity, gzip;q=0"})
+    h._send(200, big)
+    status, headers, body = _response(out)
+    assert "Content-Encoding" not in headers and json.loads(body) == big
+
+
+def test_stage_rejects_when_queue_is_full_and_admits_after_release():
+    stage = admission.Stage("test", limit=1, max_queue=1, typical_sec=0.01)
+    admitted = []
+
+    def wait_for_slot():
+        with stage.admit(time.monotonic() + 2):
+            admitted.append(time.monotonic())
+
+    with stage.admit(time.monotonic() + 1):
+        waiter = threading.Thread(target=wait_for_slot)
+        waiter.start()
+        while stage.expected_wait() < 0.015:  # the waiter is now queued
+            time.sleep(0.001)
+        try:
+            with stage.admit(time.monotonic() + 1):
+                raise AssertionError("a full queue must reject")
+        except admission.Overloaded as exc:
+            assert exc.retry_after >= 1
+        assert admitted == []  # still queued behind us
+        released = time.monotonic()
+    waiter.join(timeout=2)
+    assert len(admitted) == 1 and admitted[0] >= released
+    # The waiter gave its slot back on the way out.
+    with stage.admit(time.monotonic()):
+        pass
+
+
+def test_stage_rejects_up_front_when_wait_overshoots_deadline():
+    stage = admission.Stage("test", limit=1, max_queue=10, typical_sec=30.0)
+    with stage.admit(time.monotonic() + 1):
+        started = time.monotonic()
+        try:
+            with stage.admit(time.monotonic() + 1):
+                raise AssertionError("should not be admitted")
+        except admission.Overloaded as exc:
+            assert exc.retry_after == 30
+        assert time.monotonic() - started < 0.5
+
+
+def test_saturated_ai_stage_degrades_to_heuristic_without_network():
+    saved = admission.AI
+    admission.AI = admission.Stage("ai", limit=1, max_queue=0)
+    try:
+        with admission.AI.admit(time.monotonic() + 1):
+            payload = explain._build_response("def f(a):\n    for x in a:\n        print(x)", "python")
+    finally:
+        admission.AI = saved
+    assert payload["ai"] is False
+    assert payload["complexity"].startswith("O(n)")
+    assert payload["steps"] and payload["diagram"].startswith("flowchart TD")
+
+
+def test_concurrent_insights_share_one_model_call_with_per_item_fallback():
+    prompts = []
+
+    def fake_model(prompt):
+        prompts.append(prompt)
+        # Answers for every snippet but the second, out of order.
+        n = prompt.count("Snippet id ")
+        return "```json\n" + json.dumps([{"id": str(i), "summary": f"snippet {i}", "complexity": "O(n)"}
+                                          for i in range(n, 0, -1) if i != 2]) + "\n```"
+
+    codes = [f"def f{i}(a):\n    for x in a:\n        print(x)" for i in range(4)]
+    irs = [parser.parse_python_to_ir(code) for code in codes]
+    results = [None] * len(codes)
+    saved = ai._complete, ai._BATCHER, ai._STATIC_CONFIDENCE
+    ai._complete = fake_model
+    ai._STATIC_CONFIDENCE = 2.0  # never trust the static answer: always ask
+    ai._BATCHER = ai._Batcher(ai._ask_model, window_sec=0.5, max_items=len(codes), max_chars=10_000)
+    try:
+        def run(i):
+            results[i] = ai.generate_insights(codes[i], [], irs[i])
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(codes))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        ai._complete, ai._BATCHER, ai._STATIC_CONFIDENCE = saved
+
+    assert len(prompts) == 1 and prompts[0].count("Snippet id ") == len(codes)
+    ai_summaries = sorted(r["summary"] for r in results if r["ai"])
+    assert ai_summaries == ["snippet 1", "snippet 3", "snippet 4"]
+    assert [r["ai"] for r in results].count(False) == 1  # the skipped one got the heuristic
+
+
+def test_concurrent_insights_are_not_batched_by_default():
+    prompts = []
+    started = threading.Barrier(3)
+
+    def fake_model(prompt):
+        prompts.append(prompt)
+        return json.dumps({"summary": "one snippet", "complexity": "O(n)"})
+
+    codes = [f"def g{i}(a):\n    for x in a:\n        print(x)" for i in range(3)]
+    saved = ai._complete, ai._STATIC_CONFIDENCE
+    ai._complete = fake_model
+    ai._STATIC_CONFIDENCE = 2.0
+    try:
+        def run(code):
+            started.wait()
+            ai.generate_insights(code, [], parser.parse_python_to_ir(code))
+
+        threads = [threading.Thread(target=run, args=(code,)) for code in codes]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        ai._complete, ai._STATIC_CONFIDENCE = saved
+
+    # Batching mixes callers' code in one prompt, so it is strictly opt-in.
+    assert ai._BATCH_MAX_ITEMS == 1
+    assert len(prompts) == len(codes) and not any("Snippet id " in p for p in prompts)
+    assert all(sum(code in p for code in codes) == 1 for p in prompts)
+
+
+def test_saturated_parse_stage_answers_429_with_retry_after():
+    saved = admission.PARSE
+    admission.PARSE = admission.Stage("parse", limit=1, max_queue=0)
+    try:
+        with admission.PARSE.admit(time.monotonic() + 1):
+            body = json.dumps({"code": "x = 1", "language": "python"}).encode()
+            h, out = _handler(body)
+            h.do_POST()
+    finally:
+        admission.PARSE = saved
+    status, headers, _ = _response(out)
+    assert status == 429 and int(headers["Retry-After"]) >= 1
+
+
+def test_plain_text_upload_skips_the_json_wrapper():
+    code = "function f(n) {\n  return n;\n}\n"
+    h, _ = _handler(code.encode(), {"Content-Type": "text/plain; charset=utf-8", "X-Language": "typescript"})
+    assert h._read_input() == (code, "typescript", explain.WHOLE)
+
+    h, _ = _handler(code.encode(), {"Content-Type": "text/plain"})
+    h.path = "/api/explain?language=javascript"
+    assert h._read_input() == (code, "javascript", explain.WHOLE)
+
+
+def test_json_body_larger_than_one_chunk_is_read_whole():
+    code = "x = 1\n" * 40_000  # ~240 KB, several read chunks
+    body = json.dumps({"code": code, "language": "python"}).encode()
+    h, _ = _handler(body)
+    assert h._read_input() == (code, "python", explain.WHOLE)
+
+
+def test_body_limits_are_enforced_before_and_during_reading():
+    h, out = _handler(b"x", {"Content-Length": str(explain.MAX_CODE_BYTES + 1)})
+    assert h._read_input() is None
+    assert _response(out)[0] == 400
+
+    # Declares more than it sends: the client hung up mid-body.
+    h, out = _handler(b'{"code": "x', {"Content-Length": "500"})
+    assert h._read_input() is None
+    status, _, body = _response(out)
+    assert status == 400 and b"ended early" in body
+
+
+def test_non_string_language_is_a_400_not_a_dropped_connection():
+    for language in (123, ["python"], {"name": "python"}):
+        h, out = _handler(json.dumps({"code": "x = 1", "language": language}).encode())
+        h.do_POST()
+        status, _, body = _response(out)
+        assert status == 400 and b"language" in body
+    # Missing or null still means Python.
+    h, out = _handler(json.dumps({"code": "x = 1", "language": None}).encode())
+    h.do_POST()
+    assert _response(out)[0] == 200
+
+
+def test_analysis_size_caps_apply_below_the_body_cap():
+    big_python = "x = 1\n" * (explain._MAX_PYTHON_CHARS // 6 + 1)
+    for scoped in ({}, {"start_line": 1, "end_line": 2}):  # ast parses it all either way
+        h, out = _handler(json.dumps({"code": big_python, "language": "python", **scoped}).encode())
+        h.do_POST()
+        status, _, body = _response(out)
+        assert status == 400 and b"512 KB" in body
+
+    big_js = "x = 1;\n" * (explain._MAX_WHOLE_FILE_CHARS // 7 + 1)
+    h, out = _handler(json.dumps({"code": big_js, "language": "javascript"}).encode())
+    h.do_POST()
+    status, _, body = _response(out)
+    assert status == 400 and b"line range" in body
+    # A scoped JS request stops parsing past its range, so it may be bigger.
+    h, out = _handler(json.dumps({"code": big_js, "language": "javascript", "end_line": 3}).encode())
+    h.do_POST()
+    status, _, body = _response(out)
+    assert status == 200 and json.loads(body)["scope"] == {"start_line": 1, "end_line": 3}
+
+
+def test_large_inputs_stream_the_same_json_as_the_buffered_path():
+    code = "".join(f"def f{i}(a):\n    for x in a:\n        if x:\n            print(x)\n" for i in range(300))
+    body = json.dumps({"code": code, "language": "python"}).encode()
+    saved = admission.AI, explain._STREAM_MIN_CHARS
+    admission.AI = admission.Stage("ai", limit=1, max_queue=0)
+    explain._STREAM_MIN_CHARS = 1000
+    try:
+        with admission.AI.admit(time.monotonic() + 5):
+            expected = explain._build_response(code, "python")
+            h, out = _handler(body, {"Accept-Encoding": "gzip"})
+            h.do_POST()
+    finally:
+        admission.AI, explain._STREAM_MIN_CHARS = saved
+    status, headers, payload = _response(out)
+    assert status == 200 and "Content-Length" not in headers
+    assert headers["Content-Encoding"] == "gzip" and "ETag" not in headers
+    assert json.loads(gzip.decompress(payload)) == expected
+
+
+def test_streamed_writes_happen_outside_the_parse_slot():
+    code = "".join(f"def f{i}(a):\n    return a\n" for i in range(200))
+    saved = admission.PARSE, admission.AI, explain._STREAM_MIN_CHARS
+    admission.PARSE = admission.Stage("parse", limit=1, max_queue=0)
+    admission.AI = admission.Stage("ai", limit=1, max_queue=0)
+    explain._STREAM_MIN_CHARS = 1000
+    slot_free = []
+
+    class SlowClient(io.BytesIO):
+        def write(self, data):
+            # A slow reader blocks us right here; the parse slot must be free.
+            try:
+                with admission.PARSE.admit(time.monotonic()):
+                    slot_free.append(True)
+            except admission.Overloaded:
+                slot_free.append(False)
+            return super().write(data)
+
+    try:
+        with admission.AI.admit(time.monotonic() + 5):
+            h, _ = _handler(json.dumps({"code": code, "language": "python"}).encode())
+            h.wfile = SlowClient()
+            h.do_POST()
+    finally:
+        admission.PARSE, admission.AI, explain._STREAM_MIN_CHARS = saved
+    assert slot_free and all(slot_free)
+    assert json.loads(_response(h.wfile)[2])["steps"]
+
+
+def test_snippet_index_matches_normalized_code_and_short_circuits():
+    stored = {"language": "python", "summary": "precomputed", "complexity": "O(1)",
+              "ai": True, "steps": [], "diagram": ""}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snippets.idx")
+        key = snippets.fingerprint("def f():\n    return 1\n", "python", explain.PIPELINE_VERSION)
+        filler = [(snippets.fingerprint(f"x = {i}", "python"), {"n": i}) for i in range(20)]
+        assert snippets.write(path, filler + [(key, stored)]) == 21
+
+        index = snippets.Index(path)
+        assert len(index) == 21
+        # CRLF, trailing spaces and trailing blank lines don't matter...
+        assert index.lookup("def f():  \r\n    return 1\t\r\n\r\n", "Python", explain.PIPELINE_VERSION) == stored
+        # ...but anything that moves a line (the stored steps carry line
+        # numbers), the language and the pipeline version do.
+        assert index.lookup("\n\ndef f():\n    return 1", "python", explain.PIPELINE_VERSION) is None
+        assert index.lookup("def f():\n\n    return 1", "python", explain.PIPELINE_VERSION) is None
+        assert index.lookup("def f():\n    return 1", "javascript", explain.PIPELINE_VERSION) is None
+        assert index.lookup("def f():\n    return 1", "python", "old") is None
+
+        saved = explain._SNIPPETS
+        explain._SNIPPETS = index
+        try:
+            assert explain._build_response("def f():\n    return 1", "python")["summary"] == "precomputed"
+        finally:
+            explain._SNIPPETS = saved
+
+    assert len(snippets.Index(os.path.join(tempfile.gettempdir(), "no-such-index.idx"))) == 0
+
+
+def test_scoped_requests_explain_only_the_selected_lines():
+    code = "def a(n):\n    for i in range(n):\n        print(i)\n\n\ndef b():\n    return 1\n"
+    h, out = _handler(code.encode(), {"Content-Type": "text/plain"})
+    h.path = "/api/explain?language=python&start_line=6&end_line=7"
+    h.do_POST()
+    status, headers, body = _response(out)
+    payload = json.loads(body)
+    assert status == 200 and payload["scope"] == {"start_line": 6, "end_line": 7}
+    assert [s["line"] for s in payload["steps"]] == [6, 7]
+    assert payload["complexity"].startswith("O(1)")
+    assert headers["ETag"] != explain._etag(code, "python")
+
+    body = json.dumps({"code": code, "function": "a"}).encode()
+    h, out = _handler(body, {"Content-Type": "application/json"})
+    h.do_POST()
+    assert json.loads(_response(out)[2])["complexity"].startswith("O(n)")
+
+    for bad in ({"start_line": 0}, {"start_line": 5, "end_line": 2}, {"end_line": "ten"}):
+        h, out = _handler(json.dumps({"code": code, **bad}).encode())
+        h.do_POST()
+        assert _response(out)[0] == 400
+
+
+if __name__ == "__main__":
+    failures = 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"PASS {name}")
+            except AssertionError as exc:
+                failures += 1
+                print(f"FAIL {name}: {exc}")
+    sys.exit(1 if failures else 0)
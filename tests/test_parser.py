@@ -6,11 +6,13 @@ These avoid the network entirely, so they're fast and reliable. Run them with
 
 import os
 import sys
+import time
 
 # Make the serverless `_lib` package importable from the repo root.
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
 
-from _lib import explainer, graph, parser, parser_js  # noqa: E402
+from _lib import ai, complexity, explainer, graph, irpack, parser, parser_js  # noqa: E402
+from _lib.scope import from_params, source_lines  # noqa: E402
 from _lib.ai import estimate_complexity  # noqa: E402
 
 TWO_SUM = """def two_sum(nums, target):
@@ -64,6 +66,264 @@ def test_javascript_parser_handles_loops_and_returns():
     assert "For" in kinds and "Return" in kinds
 
 
+def test_javascript_parser_numbers_crlf_lines_like_splitlines():
+    js = "function f(n) {\r\n\r\n  return n;\r\n}\r\nconst x = 1;"
+    ir = parser_js.parse_jsts_to_ir(js)
+    fn, assign = ir["body"]
+    assert fn["line"] == 1 and fn["body"][0]["line"] == 3
+    assert assign["line"] == 5 and assign["value"] == "1"
+
+
+def test_javascript_parser_splits_lone_cr_and_other_line_breaks():
+    js = "function f(n) {\r  for (const x of n) {\r    console.log(x);\r  }\r  return n;\r}"
+    fn = parser_js.parse_jsts_to_ir(js)["body"][0]
+    assert [c["kind"] for c in fn["body"]] == ["For", "Return"] and fn["body"][1]["line"] == 5
+
+    mixed = "a = 1;\r\nb = 2;\rc = 3;\u2028d = 4;\x0ce = 5;\n\n"
+    assert list(parser_js._iter_lines(mixed)) == mixed.splitlines()
+
+
+def test_scoped_source_lines_count_lines_like_the_parser():
+    # A form feed ends a line for the JS parser but not for Python's ast.
+    js = "function a() {\n  return 1;\n}\x0c\nfunction b(xs) {\n  for (const x of xs) {\n    f(x);\n  }\n}\n"
+    span = parser_js.parse_jsts_to_ir(js, from_params(None, None, "b"))["scope"]
+    assert span == {"start_line": 5, "end_line": 9}
+    assert source_lines(js, 5, 9, "javascript").startswith("function b(xs) {")
+    assert source_lines(js, 5, 9, "javascript").endswith("  }\n}")
+
+    py = "x = 1\x0c\ndef g():\n    return 2\n"
+    span = parser.parse_python_to_ir(py, from_params(None, None, "g"))["scope"]
+    assert source_lines(py, span["start_line"], span["end_line"], "python") == "def g():\n    return 2"
+
+
+def test_streaming_generators_match_their_list_counterparts():
+    ir = parser.parse_python_to_ir("def f(a):\n    while a:\n        a -= 1\n    return a")
+    assert list(explainer.iter_explain_ir(ir)) == explainer.explain_ir(ir)
+    assert "\n".join(graph.iter_mermaid(ir)) == graph.ir_to_mermaid(ir)
+
+
+MERGE_SORT = """def merge(a, b):
+    out = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i] < b[j]:
+            out.append(a[i])
+            i += 1
+        else:
+            out.append(b[j])
+            j += 1
+    return out + a[i:] + b[j:]
+
+def merge_sort(a):
+    if len(a) <= 1:
+        return a
+    mid = len(a) // 2
+    return merge(merge_sort(a[:mid]), merge_sort(a[mid:]))"""
+
+
+def test_static_analyzer_handles_recursion_and_halving():
+    def big_o(code):
+        return complexity.analyze(parser.parse_python_to_ir(code))["big_o"]
+
+    assert big_o(MERGE_SORT) == "O(n log n)"
+    assert big_o("def fib(n):\n    if n < 2:\n        return n\n    return fib(n - 1) + fib(n - 2)") == "O(2^n)"
+    assert big_o("def fact(n):\n    if n == 0:\n        return 1\n    return n * fact(n - 1)") == "O(n)"
+    binary_search = (
+        "def bs(a, t):\n    lo, hi = 0, len(a) - 1\n    while lo <= hi:\n"
+        "        mid = (lo + hi) // 2\n        if a[mid] < t:\n            lo = mid + 1\n"
+        "        else:\n            hi = mid\n    return lo")
+    assert big_o(binary_search) == "O(log n)"
+
+
+def test_static_analyzer_prices_calls_across_functions():
+    report = complexity.analyze(parser.parse_python_to_ir(
+        "def total(xs):\n    return sum(xs)\n\n"
+        "def f(xs):\n    for x in sorted(xs):\n        print(total(xs))"))
+    assert report["functions"] == {"total": "O(n)", "f": "O(n^2)"}
+    assert report["confidence"] == 1.0
+
+    dedupe = "def f(a):\n    seen = []\n    for x in a:\n        if x not in seen:\n            seen.append(x)"
+    assert complexity.analyze(parser.parse_python_to_ir(dedupe))["big_o"] == "O(n^2)"
+    fixed = "def f(a):\n    for i in range(10):\n        print(a)"
+    assert complexity.analyze(parser.parse_python_to_ir(fixed))["big_o"] == "O(1)"
+
+
+def test_static_analyzer_is_unsure_about_what_it_cannot_see():
+    assert complexity.analyze(parser.parse_python_to_ir(TWO_SUM))["confidence"] == 1.0
+    unbounded = "def f(a):\n    while True:\n        if step(a):\n            break"
+    assert complexity.analyze(parser.parse_python_to_ir(unbounded))["confidence"] < 0.9
+    opaque = "class A:\n    def f(self):\n        for x in self.a:\n            pass"
+    assert complexity.analyze(parser.parse_python_to_ir(opaque))["confidence"] < 0.9
+
+
+def test_static_analyzer_takes_the_worst_return_path_not_the_sum():
+    recursive_bs = (
+        "def bs(a, t, lo, hi):\n    if lo > hi:\n        return -1\n    mid = (lo + hi) // 2\n"
+        "    if a[mid] == t:\n        return mid\n    if a[mid] < t:\n        return bs(a, t, mid + 1, hi)\n"
+        "    return bs(a, t, lo, mid - 1)")
+    report = complexity.analyze(parser.parse_python_to_ir(recursive_bs))
+    assert report["big_o"] == "O(log n)" and report["confidence"] == 1.0
+    js_bs = ("function bs(a, t, lo, hi) {\n  if (lo > hi) {\n    return -1;\n  }\n"
+             "  const mid = Math.floor((lo + hi) / 2);\n  if (a[mid] < t) {\n    return bs(a, t, mid + 1, hi);\n  }\n"
+             "  return bs(a, t, lo, mid - 1);\n}")
+    assert complexity.analyze(parser_js.parse_jsts_to_ir(js_bs))["big_o"] == "O(log n)"
+
+
+def test_static_analyzer_defers_unknown_calls_to_the_model():
+    for code in ("def f(a):\n    return np.linalg.inv(a)",
+                 "import bisect\ndef f(xs):\n    out = []\n    for x in xs:\n        bisect.insort(out, x)"):
+        assert complexity.analyze(parser.parse_python_to_ir(code))["confidence"] < ai._STATIC_CONFIDENCE
+    # Known calls, including one chained off another call's result, stay trusted.
+    sure = complexity.analyze(parser.parse_python_to_ir("def f(xs):\n    return sorted(xs).index(max(xs, key=len))"))
+    assert sure["big_o"] == "O(n log n)" and sure["confidence"] == 1.0
+    # max(a, b) compares two values; max(xs) scans.
+    assert complexity.analyze(parser.parse_python_to_ir("def f(a, b):\n    return max(a, min(b, 3))"))["big_o"] == "O(1)"
+    assert complexity.analyze(parser.parse_python_to_ir("def f(s):\n    return s == 'for x in xs'"))["big_o"] == "O(1)"
+
+
+def test_static_analyzer_multiplies_per_item_work_by_the_items():
+    def report(code, parse=parser.parse_python_to_ir):
+        r = complexity.analyze(parse(code))
+        return r["big_o"], r["confidence"] >= ai._STATIC_CONFIDENCE
+
+    linear_helper = "def g(xs):\n    return sum(xs)\n\n"
+    for code in ("def f(xs):\n    return [x for x in xs if xs.count(x) > 1]",
+                 linear_helper + "def f(xs):\n    return [g(xs) for x in xs]",
+                 "def f(xs):\n    seen = []\n    return [x for x in xs if x in seen]",
+                 linear_helper + "def f(xs):\n    return list(map(g, xs))",
+                 "def f(xs):\n    xs.sort(key=lambda x: xs.index(x))",
+                 "def f(xs):\n    return {k: xs.count(k) for k in set(xs)}"):
+        assert report(code) == ("O(n^2)", True), code
+    assert report("function f(xs) {\n  return xs.map(x => xs.indexOf(x));\n}",
+                  parser_js.parse_jsts_to_ir) == ("O(n^2)", True)
+
+    # Cheap per-item work stays linear, and the iterable is evaluated once.
+    assert report("def f(xs):\n    return [x * 2 for x in xs if x]") == ("O(n)", True)
+    assert report("def f(xs):\n    return [x for x in sorted(xs)]") == ("O(n log n)", True)
+    assert report("def f(xs):\n    return list(map(str, xs))") == ("O(n)", True)
+    assert report("function f(xs) {\n  return xs.sort((a, b) => a - b);\n}",
+                  parser_js.parse_jsts_to_ir) == ("O(n log n)", True)
+    # A callback we can't price sends the question to the model.
+    assert report("def f(xs):\n    return list(map(helper, xs))")[1] is False
+
+
+def test_static_analyzer_reads_the_step_of_c_style_loops():
+    def report(step):
+        code = f"function f(n) {{\n  for (let i = 1; i < n; {step}) {{\n    console.log(i);\n  }}\n}}"
+        r = complexity.analyze(parser_js.parse_jsts_to_ir(code))
+        return r["big_o"], r["confidence"] >= ai._STATIC_CONFIDENCE
+
+    for step in ("i *= 2", "i = i * 3", "i <<= 1", "i = Math.floor(i / 10)"):
+        assert report(step) == ("O(log n)", True), step
+    for step in ("i++", "--i", "i += 2", "i = i + 1", "i++, j--"):
+        assert report(step) == ("O(n)", True), step
+    for step in ("i *= 1", "i = next(i)", ""):
+        assert report(step) == ("O(n)", False), step
+
+    while_loop = "def f(n):\n    i = 1\n    while i < n:\n        i = i * {}\n    return i"
+    assert complexity.analyze(parser.parse_python_to_ir(while_loop.format(3)))["big_o"] == "O(log n)"
+    assert complexity.analyze(parser.parse_python_to_ir(while_loop.format(1)))["big_o"] == "O(n)"
+
+
+# Expressions built to make the analyzer's scans go quadratic.
+ANALYZER_ADVERSARIAL = {
+    "string": lambda n: ('x = "' + "for aaaa " * (n // 9) + '"', parser.parse_python_to_ir),
+    "nested_calls": lambda n: ("x = " + "f(" * (n // 3) + ")" * (n // 3) + ";", parser_js.parse_jsts_to_ir),
+    "dotted_chain": lambda n: ("x = " + "a." * (n // 2) + "b;", parser_js.parse_jsts_to_ir),
+    "long_name": lambda n: ("x = " + "a" * n + ";", parser_js.parse_jsts_to_ir),
+    "slice_colons": lambda n: ("x = [" + ":" * n + ";", parser_js.parse_jsts_to_ir),
+    "comprehension_heads": lambda n: ("x = " + "for a " * (n // 6) + ";", parser_js.parse_jsts_to_ir),
+    "callbacks": lambda n: ("x = " + "xs.map(x => " * (n // 12) + ")" * (n // 12) + ";", parser_js.parse_jsts_to_ir),
+    "key_args": lambda n: ("x = max(" + "a, key=" * (n // 7) + ");", parser_js.parse_jsts_to_ir),
+}
+
+
+def _analyze_seconds(ir):
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        complexity.analyze(ir)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def test_static_analyzer_runs_in_linear_time_on_crafted_expressions():
+    for name, build in ANALYZER_ADVERSARIAL.items():
+        small, large = (parse(code) for code, parse in (build(10_000), build(100_000)))
+        t_small, t_large = _analyze_seconds(small), _analyze_seconds(large)
+        assert t_large < 0.2, f"{name}: {t_large:.3f}s"
+        assert t_large < 30 * t_small + 0.01, f"{name} scales super-linearly"
+
+
+def test_irpack_round_trips_python_and_javascript_ir():
+    for ir in (parser.parse_python_to_ir(TWO_SUM + "\n\n" + MERGE_SORT),
+               parser_js.parse_jsts_to_ir("function f(n) {\n  if (n) {\n    return n;\n  }\n}"),
+               {"kind": "Module", "body": [{"kind": "If", "line": None, "elif": True, "orelse": []},
+                                           {"kind": "ImportFrom", "level": -2, "names": [{"name": "é"}]}]}):
+        blob = irpack.encode(ir)
+        assert irpack.decode(blob) == ir
+        assert irpack.decode(memoryview(bytearray(blob))) == ir
+
+
+def test_irpack_view_reads_columns_without_decoding():
+    ir = parser.parse_python_to_ir(TWO_SUM)
+    view = irpack.IRView(irpack.encode(ir))
+    assert list(view.kinds()) == ["Module", "FunctionDef", "Assign", "For", "If", "Return", "Assign", "Return"]
+    assert list(view.lines()) == [None, 1, 2, 3, 4, 5, 6, 7]
+    try:
+        irpack.decode(b"JSON" + bytes(16))
+        raise AssertionError("bad magic must be rejected")
+    except ValueError:
+        pass
+
+
+def test_irpack_rejects_truncated_and_corrupt_buffers_with_value_error():
+    import random
+
+    blob = irpack.encode(parser.parse_python_to_ir(TWO_SUM))
+    for cut in range(len(blob)):
+        try:
+            irpack.decode(blob[:cut])
+            raise AssertionError(f"a buffer cut at {cut} bytes must be rejected")
+        except ValueError:
+            pass
+    rng = random.Random(7)
+    for _ in range(2000):
+        damaged = bytearray(blob)
+        for _ in range(rng.randrange(1, 4)):
+            damaged[rng.randrange(len(damaged))] = rng.randrange(256)
+        try:
+            irpack.decode(damaged)
+            list(irpack.IRView(damaged).kinds())
+        except ValueError:
+            pass  # anything else (IndexError, struct.error, ...) fails the test
+
+
+def test_scope_keeps_only_the_top_level_statements_it_touches():
+    source = "import os\n\n" + TWO_SUM + "\n\n@cache\n" + MERGE_SORT
+    ir = parser.parse_python_to_ir(source, from_params(start_line=5, end_line=6))
+    assert [n["name"] for n in ir["body"]] == ["two_sum"]
+    assert ir["scope"] == {"start_line": 3, "end_line": 9}
+
+    ir = parser.parse_python_to_ir(source, from_params(function="merge"))
+    assert [n["name"] for n in ir["body"]] == ["merge"]
+    assert ir["scope"]["start_line"] == ir["body"][0]["line"] - 1  # the decorator line
+    try:
+        parser.parse_python_to_ir(source, from_params(function="missing"))
+        raise AssertionError("an unknown function must be rejected")
+    except ValueError:
+        pass
+
+
+def test_javascript_scope_stops_parsing_past_the_range():
+    js = "function a(x) {\n  if (x) {\n    return 1;\n  } else {\n    return 2;\n  }\n}\n" \
+         "const b = 1;\nfunction c() {\n  return 3;\n}\n"
+    ir = parser_js.parse_jsts_to_ir(js + "function broken(\n" * 1000, from_params(start_line=6, end_line=8))
+    assert [n.get("name", n["summary"]) for n in ir["body"]] == ["a", "assign b"]
+    assert ir["scope"] == {"start_line": 1, "end_line": 8}
+    assert parser_js.parse_jsts_to_ir(js, from_params(function="c"))["scope"] == {"start_line": 9, "end_line": 11}
+
+
 if __name__ == "__main__":
     failures = 0
     for name, fn in list(globals().items()):
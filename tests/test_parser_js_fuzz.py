@@ -0,0 +1,210 @@
+"""Property and fuzz tests for the JS/TS line matchers.
+
+The matchers in `_lib/parser_js.py` replaced a set of backtracking regexes.
+These tests hold them to two promises: they give exactly the groups the old
+regexes gave on any line (checked against those regexes, kept here as the
+reference, over seeded random lines), and their run time stays linear in the
+line length on inputs crafted to make regexes backtrack.
+
+Run them with `python tests/test_parser_js_fuzz.py` or `pytest`.
+"""
+
+import os
+import random
+import re
+import sys
+import time
+
+# Make the serverless `_lib` package importable from the repo root.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+import explain  # noqa: E402
+from _lib import parser_js  # noqa: E402
+
+# The original patterns, verbatim: the reference for what each matcher returns.
+REFERENCE = {
+    "function": re.compile(r"^\s*(?:export\s+)?(?:async\s+)?function\s+([A-Za-z_$][\w$]*)\s*\(([^)]*)\)\s*\{\s*$"),
+    "arrow": re.compile(r"^\s*(?:export\s+)?const\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?\(([^)]*)\)\s*=>\s*\{\s*$"),
+    "if": re.compile(r"^\s*(?:\}\s*)?(?:else\s+)?if\s*\((.*)\)\s*\{\s*$"),
+    "else": re.compile(r"^\s*(?:\}\s*)?else\s*\{\s*$"),
+    "for_of_in": re.compile(r"^\s*for\s*\(\s*(?:const|let|var)\s+([^\s;]+)\s+(of|in)\s+(.*)\)\s*\{\s*$"),
+    "for_c": re.compile(r"^\s*for\s*\((.*);(.*);(.*)\)\s*\{\s*$"),
+    "while": re.compile(r"^\s*while\s*\((.*)\)\s*\{\s*$"),
+    "return": re.compile(r"^\s*return(?:\s+(.*?))?;?\s*$"),
+    "aug": re.compile(r"^\s*([A-Za-z_$][\w$.\[\]]*)\s*(\+=|-=|\*=|/=|%=|\^=|\|=|&=|<<=|>>=)\s*(.*);?\s*$"),
+    "assign": re.compile(r"^\s*(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(.*?);?\s*$"
+                         r"|^\s*([A-Za-z_$][\w$.\[\]]*)\s*=\s*(.*?);?\s*$"),
+    # Extended with a group for the arguments, which the IR now keeps.
+    "call": re.compile(r"^\s*([A-Za-z_$][\w$.]*)\s*\((.*)\)\s*;?\s*$"),
+}
+
+
+def _function_only(line):
+    m = parser_js._FUNC_HEAD.match(line)
+    return parser_js._match_function(line) if m else None
+
+
+def _arrow_only(line):
+    return None if parser_js._FUNC_HEAD.match(line) else parser_js._match_function(line)
+
+
+MATCHERS = {
+    "function": _function_only,
+    "arrow": _arrow_only,
+    "if": lambda line: parser_js._match_condition(parser_js._IF_HEAD, line),
+    "else": lambda line: () if parser_js._ELSE.fullmatch(line) else None,
+    "for_of_in": parser_js._match_for_of_in,
+    "for_c": parser_js._match_for_c,
+    "while": lambda line: parser_js._match_condition(parser_js._WHILE_HEAD, line),
+    "return": parser_js._match_return,
+    "aug": parser_js._match_aug,
+    "assign": parser_js._match_assign,
+    "call": parser_js._match_call,
+}
+
+
+def _expected(name, line):
+    m = REFERENCE[name].match(line)
+    if not m:
+        return None
+    if name == "assign":  # one alternative or the other matched
+        return (m.group(1), m.group(2)) if m.group(1) is not None else (m.group(3), m.group(4))
+    return m.groups()
+
+
+# Fragments that steer random lines into (and just past) every construct.
+_HEADS = ["", " ", "\t", "}", "} ", "export ", "async ", "function ", "const ", "let ", "var ",
+          "if", "if ", "} else if ", "else", "} else ", "for ", "for", "while ", "return", "return ",
+          "returned", "x", "a.b", "$x", "arr[0]", "_", "f", "é"]
+_TOKENS = [" ", "  ", "\t", " ", "(", ")", "(", ")", "{", "}", ";", ";", "=", "==", "=>",
+           "+=", "<<=", ">>=", "|=", "x", "y1", "a.b", "[i]", "$", "of", "in", " of ", " in ",
+           "const", "let ", "async", "1", "'s'", ",", "é", "\r"]
+
+
+# Lines each construct matches, to mutate a few tokens at a time.
+_TEMPLATES = [
+    "function f(a, b) {", "export async function g() {", "const h = (x) => {",
+    "export const k = async (a, b) => {", "if (a < b) {", "} else if (x) {", "} else {",
+    "for (const x of xs) {", "for (let k in obj) {", "for (let i = 0; i < n; i++) {",
+    "while (lo <= hi) {", "return a + b;", "return;", "total += x;", "x <<= 1",
+    "const y = f(x);", "a.b[0] = 1", "console.log(x);", "go(a)(b)",
+]
+
+
+def _mutate(rng, line):
+    for _ in range(rng.randrange(0, 4)):
+        at = rng.randrange(0, len(line) + 1)
+        cut = rng.randrange(0, 3)
+        line = line[:at] + rng.choice(_TOKENS + [""]) + line[at + cut:]
+    return line
+
+
+def _random_line(rng):
+    if rng.random() < 0.5:
+        return _mutate(rng, rng.choice(_TEMPLATES)).rstrip()
+    parts = [rng.choice(_HEADS)]
+    parts += [rng.choice(_TOKENS) for _ in range(rng.randrange(0, 14))]
+    if rng.random() < 0.5:
+        parts.append(rng.choice([") {", "){", ") => {", ");", ")", ";", "{", " {", "; ", "  "]))
+    return "".join(parts).rstrip()
+
+
+def test_matchers_agree_with_the_reference_regexes_on_random_lines():
+    rng = random.Random(20240917)
+    seen = {name: 0 for name in MATCHERS}
+    for _ in range(30_000):
+        line = _random_line(rng)
+        for name, matcher in MATCHERS.items():
+            expected = _expected(name, line)
+            assert matcher(line) == expected, f"{name} differs on {line!r}"
+            seen[name] += expected is not None
+    # The generator must actually exercise every construct, not just misses.
+    assert all(count > 20 for count in seen.values()), seen
+
+
+def test_matchers_agree_on_hand_picked_edge_cases():
+    lines = [
+        "return", "return;", "return ;", "return x ;", "return x;;", "returnx", "return\tx",
+        "x = a ;", "const x =", "const= 5", "let [a, b] = f()", "a == b", "x += 1;",
+        "for (let i = 0; i < n; i++) {", "for (;;) {", "for (a; b) {", "for (a;b;c;d) {",
+        "for (const k in obj) {", "for (const  of of xs) {", "if (a) { b }", "if (a)) {",
+        "} else if (x) {", "}else{", "function f(a, b) {", "function f(a) ) {",
+        "export const g = async (x) => {", "const g = (x) =>{", "f();", "f() ;", "a.b(c)(d)",
+        "f(", "f)", "f (x) ;",
+    ]
+    for line in lines:
+        for name, matcher in MATCHERS.items():
+            assert matcher(line) == _expected(name, line), f"{name} differs on {line!r}"
+
+
+# Lines built to make the old patterns backtrack: separators the greedy groups
+# must try one by one, long whitespace runs before a mismatch, and so on.
+ADVERSARIAL = {
+    "for_c": lambda n: "for (" + ";" * n,
+    "for_c_parens": lambda n: "for (" + ";)" * n + " x",
+    "return_spaces": lambda n: "return a" + " " * n + "b",
+    "assign_spaces": lambda n: "x = a" + " " * n + "b",
+    "call_spaces": lambda n: "f(" + ")" + " " * n + "x",
+    "call_parens": lambda n: "f(" + ") " * n + "x",
+    "if_parens": lambda n: "if (" + ") {" * n + " x",
+    "for_of": lambda n: "for (const x of " + "(" * n,
+    "function_args": lambda n: "function f(" + "a," * n,
+    "arrow": lambda n: "const f = (" + ") =>" * n,
+    "aug": lambda n: "x" + "." * n + " +",
+}
+
+# Generous for CI: the matchers run at C speed, ~a few ns per byte.
+_MAX_SECONDS_PER_BYTE = 2e-6
+
+
+def _parse_seconds(line):
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        parser_js.parse_jsts_to_ir(line, budget_sec=0)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def test_adversarial_lines_parse_in_linear_time():
+    for name, build in ADVERSARIAL.items():
+        small, large = build(10_000), build(100_000)
+        t_small, t_large = _parse_seconds(small), _parse_seconds(large)
+        assert t_large / len(large) < _MAX_SECONDS_PER_BYTE, f"{name}: {t_large:.3f}s for {len(large)} bytes"
+        # 10x the input may not cost much more than 10x the time (allow noise
+        # on the tiny small-case timings).
+        assert t_large < 30 * t_small + 0.01, f"{name} scales super-linearly"
+
+
+def test_cpu_budget_aborts_with_a_client_error():
+    code = "x = 1;\n" * 5_000
+    try:
+        parser_js.parse_jsts_to_ir(code, budget_sec=1e-9)
+        raise AssertionError("the budget must stop the parse")
+    except parser_js.ParseBudgetExceeded as exc:
+        assert isinstance(exc, ValueError) and "too long" in str(exc)
+    assert parser_js.parse_jsts_to_ir(code, budget_sec=0)["body"]  # 0 disables it
+
+    saved = parser_js._CPU_BUDGET_SEC
+    parser_js._CPU_BUDGET_SEC = 1e-9
+    try:
+        try:
+            explain._build_response(code, "javascript")
+            raise AssertionError("the handler must see the budget error")
+        except ValueError as exc:  # do_POST answers these with 400
+            assert "too long" in str(exc)
+    finally:
+        parser_js._CPU_BUDGET_SEC = saved
+
+
+if __name__ == "__main__":
+    failures = 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"PASS {name}")
+            except AssertionError as exc:
+                failures += 1
+                print(f"FAIL {name}: {exc}")
+    sys.exit(1 if failures else 0)
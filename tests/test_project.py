@@ -0,0 +1,173 @@
+"""Tests for project mode: the symbol index and the /api/project endpoint.
+
+No network involved. Run them with `python tests/test_project.py` or `pytest`.
+"""
+
+import io
+import json
+import os
+import sys
+import time
+import zipfile
+
+# Make the serverless `_lib` package importable from the repo root.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+import project as endpoint  # noqa: E402
+from _lib import project  # noqa: E402
+
+FILES = [
+    ("pkg/__init__.py", ""),
+    ("pkg/search.py", "from .util import contains\nimport pkg.util as u\n\n"
+                      "def find_all(xs, ys):\n    out = []\n    for y in ys:\n"
+                      "        if contains(xs, y):\n            out.append(y)\n    return u.first(out)\n"),
+    ("pkg/util.py", "def contains(xs, y):\n    for x in xs:\n        if x == y:\n            return True\n"
+                    "    return False\n\n\ndef first(xs):\n    return xs[0] if xs else None\n"),
+    ("pkg/broken.py", "def oops(:\n"),
+    ("web/math.js", "export function add(a, b) {\n  return a + b;\n}\n"),
+    ("web/lib/index.ts", "export function total(xs) {\n  let t = 0;\n  for (const x of xs) {\n"
+                         "    t += x;\n  }\n  return t;\n}\n"),
+    ("web/main.js", "import { add as plus } from './math.js';\nimport * as lib from './lib';\n"
+                    "function run(rows) {\n  const s = lib.total(rows);\n  return plus(s, 1);\n}\n"),
+    ("notes.md", "not code"),
+]
+
+
+def test_index_resolves_calls_across_modules_and_languages():
+    index = project.build(FILES, workers=1)
+    assert sorted(index.symbols) == ["pkg.search.find_all", "pkg.util.contains", "pkg.util.first",
+                                     "web/lib/index.total", "web/main.run", "web/math.add"]
+    assert index.edges() == [("pkg.search.find_all", "pkg.util.contains"),
+                             ("pkg.search.find_all", "pkg.util.first"),
+                             ("web/main.run", "web/lib/index.total"),
+                             ("web/main.run", "web/math.add")]
+    broken = [f for f in index.files if f["error"]]
+    assert [f["path"] for f in broken] == ["pkg/broken.py"]
+    assert index.lookup("first").qualname == "pkg.util.first"
+    try:
+        index.lookup("missing")
+        raise AssertionError("unknown names must be rejected")
+    except project.UnknownSymbol:
+        pass
+
+
+def test_explain_prices_calls_into_other_modules_and_is_memoised():
+    index = project.build(FILES, workers=1)
+    answer = index.explain("find_all")
+    # A loop over ys calling a linear scan over xs in another module.
+    assert answer["complexity"].startswith("O(n^2)")
+    assert answer["called_by"] == [] and "pkg.util.contains" in answer["calls"]
+    assert answer["steps"][0]["line"] == 4 and answer["diagram"].startswith("flowchart TD")
+    assert index.explain("pkg.search.find_all") is answer
+    assert index.explain("contains")["called_by"] == ["pkg.search.find_all"]
+
+
+def test_parallel_build_matches_inline_build():
+    saved = project._MIN_PARALLEL_FILES
+    project._MIN_PARALLEL_FILES = 2
+    try:
+        parallel = project.build(FILES, workers=2)
+    finally:
+        project._MIN_PARALLEL_FILES = saved
+    inline = project.build(FILES, workers=1)
+    assert parallel.summary() == inline.summary()
+    assert all(parallel.ir(q) == inline.ir(q) for q in inline.symbols)
+
+
+def _zip(files, prefix="myproj/"):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for path, code in files:
+            zf.writestr(prefix + path, code)
+    return buf.getvalue()
+
+
+def _post(body, content_type, path="/api/project"):
+    head = (f"POST {path} HTTP/1.1\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1")
+    h = endpoint.handler.__new__(endpoint.handler)
+    h.rfile = io.BytesIO(head + body)
+    h.wfile = io.BytesIO()
+    h.client_address = ("127.0.0.1", 0)
+    h.log_message = lambda *args: None
+    h.raw_requestline = h.rfile.readline()
+    h.parse_request()
+    h.do_POST()
+    head, _, payload = h.wfile.getvalue().partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+def test_zip_upload_indexes_once_and_answers_follow_ups_from_cache():
+    endpoint._cache.clear()
+    status, summary = _post(_zip(FILES), "application/zip")
+    assert status == 200 and len(summary["symbols"]) == 6
+    assert {"from": "web/main.run", "to": "web/math.add", "cross_module": True} in summary["calls"]
+
+    calls = []
+    saved = project.build
+    project.build = lambda *a, **k: calls.append(a) or saved(*a, **k)
+    try:
+        status, answer = _post(json.dumps({"project": summary["project"], "symbol": "run"}).encode(),
+                               "application/json")
+        assert status == 200 and answer["calls"] == ["web/lib/index.total", "web/math.add"]
+        status, answer = _post(_zip(FILES), "application/zip", "/api/project?symbol=first")
+        assert status == 200 and answer["symbol"]["path"] == "pkg/util.py"
+    finally:
+        project.build = saved
+    assert calls == []  # both follow-ups came from the cached index
+
+    assert _post(json.dumps({"project": "nope"}).encode(), "application/json")[0] == 404
+    assert _post(json.dumps({"project": summary["project"], "symbol": "zzz"}).encode(),
+                 "application/json")[0] == 404
+    assert _post(b"PK not really", "application/zip")[0] == 400
+
+
+def test_a_file_too_deep_to_parse_is_reported_not_fatal():
+    deep = "def deep():\n    return " + "+".join(["1"] * 20_000) + "\n"
+    status, summary = _post(_zip([("deep.py", deep), ("ok.py", "def ok():\n    pass\n")]), "application/zip")
+    assert status == 200 and [s["name"] for s in summary["symbols"]] == ["ok.ok"]
+    assert [f["error"] for f in summary["files"] if f["path"] == "deep.py"] == ["too deeply nested to analyze"]
+
+
+def test_symbol_follow_ups_wait_for_a_parse_slot_and_oversized_files_are_skipped():
+    from _lib import admission
+
+    endpoint._cache.clear()
+    files = FILES + [("pkg/huge.py", "def huge():\n    pass\n" + "#" * project._MAX_FILE_CHARS)]
+    status, summary = _post(_zip(files), "application/zip")
+    assert status == 200 and "pkg.huge.huge" not in [s["name"] for s in summary["symbols"]]
+    assert [f["error"] for f in summary["files"] if f["path"] == "pkg/huge.py"][0].startswith("file too large")
+
+    saved = admission.PARSE
+    admission.PARSE = admission.Stage("parse", limit=1, max_queue=0)
+    try:
+        with admission.PARSE.admit(time.monotonic() + 1):
+            # The summary is a cheap lookup; explaining a symbol is CPU work.
+            assert _post(json.dumps({"project": summary["project"]}).encode(), "application/json")[0] == 200
+            assert _post(json.dumps({"project": summary["project"], "symbol": "run"}).encode(),
+                         "application/json")[0] == 429
+            assert _post(_zip(files), "application/zip", "/api/project?symbol=first")[0] == 429
+        assert _post(json.dumps({"project": summary["project"], "symbol": "run"}).encode(),
+                     "application/json")[0] == 200
+    finally:
+        admission.PARSE = saved
+
+
+def test_zip_upload_ignores_paths_outside_the_project():
+    status, summary = _post(_zip([("../evil.py", "def evil():\n    pass\n"),
+                                  ("node_modules/dep/index.js", "function dep() {\n}\n"),
+                                  ("ok.py", "def ok():\n    pass\n")], prefix=""), "application/zip")
+    assert status == 200 and [s["name"] for s in summary["symbols"]] == ["ok.ok"]
+
+
+if __name__ == "__main__":
+    failures = 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"PASS {name}")
+            except AssertionError as exc:
+                failures += 1
+                print(f"FAIL {name}: {exc}")
+    sys.exit(1 if failures else 0)